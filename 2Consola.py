@@ -1,303 +1,2535 @@
 import time
 from datetime import datetime, timedelta
+import bisect
+import functools
+import heapq
+import itertools
 import json
-import pandas as pd
-from tkinter.filedialog import asksaveasfilename
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+from collections import deque
+from collections.abc import MutableSequence, Sequence
+
+LIMITE_JOURNAL = 256 * 1024  # bytes; acima disto o snapshot é reescrito em segundo plano
+LIMITE_HISTORICO = 50  # ações guardadas para desfazer
+ATRASO_AUTOSAVE = 0.5  # segundos sem alterações antes de gravar
+FORMATO_COMPACTO = "tarefas-jsonl"
+VERSAO_FORMATO = 1
+PRIORIDADE_ORDEM = {'Alta': 1, 'Média': 2, 'Baixa': 3}
+# Valores guardados como inteiros pequenos em cada Tarefa (outros textos ficam como estão)
+PRIORIDADES = ('Alta', 'Média', 'Baixa')
+RECORRENCIAS = (None, 'diaria', 'semanal', 'mensal', 'anual')
+_CODIGO_PRIORIDADE = {p: i for i, p in enumerate(PRIORIDADES)}
+_CODIGO_RECORRENCIA = {r: i for i, r in enumerate(RECORRENCIAS)}
+DIAS_SEMANA = ('seg', 'ter', 'qua', 'qui', 'sex', 'sab', 'dom')
+TAMANHO_PAGINA = 20  # tarefas por página na listagem da consola
+LINHAS_POR_ESCRITA = 256  # linhas juntadas em cada escrita para o terminal
+COLUNAS_EXPORTACAO = ("Tarefa Principal", "Título", "Prioridade", "Prazo", "Concluída", "Etiquetas",
+                      "Comentários", "Tipo", "Nível")
+LINHAS_POR_LOTE = 1000  # linhas escritas de cada vez na exportação para Parquet
+PROGRESSO_EXPORTACAO = 200  # tarefas principais entre cada aviso de progresso da exportação
+HORIZONTE_AGENDA = 90  # dias mostrados pela agenda (tarefas e ocorrências de tarefas recorrentes)
+LIMITE_CACHE_REGRAS = 1024  # textos de recorrência já lidos guardados (os mais usados)
+POMODORO_MINUTOS = {"trabalho": 25, "pausa": 5, "pausa longa": 15}  # duração de cada fase do Pomodoro
+CICLOS_PAUSA_LONGA = 4  # ciclos de trabalho até uma pausa longa
+# Com margem sobre o medido (cerca de 16–25 ms): sqlite3, csv e argparse só são importados quando usados
+ORCAMENTO_ARRANQUE_MS = 40  # tempo máximo gasto em imports ao carregar o programa (ver --verificar-arranque)
+# Pesquisa de texto: peso de cada campo e palavras que não contam
+PESOS_TEXTO = {"titulo": 3, "subtarefa": 2, "comentario": 1}
+PALAVRAS_VAZIAS = frozenset("a o as os e é de da do das dos em no na nos nas um uma uns umas "
+                            "para por com sem que se ao aos à às ou".split())
+
+def _escrever(linhas, saida=None): # escreve em blocos de linhas em vez de um print por linha
+    saida = saida or sys.stdout
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= LINHAS_POR_ESCRITA:
+            saida.write("\n".join(bloco) + "\n")
+            bloco.clear()
+    if bloco:
+        saida.write("\n".join(bloco) + "\n")
+    saida.flush()
+
+# Exportação: as linhas chegam de um gerador e cada formato escreve-as à medida que chegam,
+# sem juntar a lista inteira em memória (nem precisar do pandas)
+def _exportar_xlsx(caminho, linhas):
+    from openpyxl import Workbook # só é preciso para exportar
+    livro = Workbook(write_only=True) # as linhas vão para o ficheiro em sequência, sem guardar a folha em memória
+    folha = livro.create_sheet("Tarefas")
+    folha.append(COLUNAS_EXPORTACAO)
+    for linha in linhas:
+        folha.append(linha)
+    livro.save(caminho)
+
+def _exportar_csv(caminho, linhas):
+    import csv # só é preciso para exportar
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as f: # com BOM, o Excel reconhece o UTF-8
+        escritor = csv.writer(f)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        escritor.writerows(linhas)
+
+def _exportar_parquet(caminho, linhas):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("A exportação para Parquet precisa do módulo pyarrow (pip install pyarrow).") from None
+    tipos = {"Concluída": pa.bool_(), "Nível": pa.int64()}
+    esquema = pa.schema([(coluna, tipos.get(coluna, pa.string())) for coluna in COLUNAS_EXPORTACAO])
+    with pq.ParquetWriter(caminho, esquema) as escritor:
+        while True:
+            lote = list(itertools.islice(linhas, LINHAS_POR_LOTE))
+            if not lote:
+                break
+            colunas = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*lote), esquema)]
+            escritor.write_batch(pa.record_batch(colunas, schema=esquema))
+
+EXPORTADORES = {".xlsx": _exportar_xlsx, ".csv": _exportar_csv, ".parquet": _exportar_parquet}
+
+# Snapshot compacto: uma linha de cabeçalho {"formato", "versao", "seq", "proximo_id"} seguida de uma linha
+# {"t": tarefa} por tarefa e {"h": entrada} por ação do histórico. O formato antigo (um único
+# documento JSON indentado) continua a ser lido.
+def _ler_snapshot(caminho, construir=None):
+    tarefas, historico, seq = [], [], 0
+    try:
+        f = open(caminho, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return tarefas, historico, seq
+    with f:
+        primeira = f.readline()
+        try:
+            cabecalho = json.loads(primeira)
+        except json.JSONDecodeError:
+            cabecalho = None
+        if not isinstance(cabecalho, dict) or cabecalho.get("formato") != FORMATO_COMPACTO:
+            f.seek(0) # formato antigo: documento único
+            dados = json.load(f) if primeira.strip() else {}
+            tarefas = dados.get("tarefas", [])
+            if construir:
+                tarefas = [construir(t) for t in tarefas]
+            return tarefas, dados.get("historico", []), dados.get("seq", 0)
+        if cabecalho.get("versao", 1) > VERSAO_FORMATO:
+            raise ValueError(f"'{caminho}' usa a versão {cabecalho['versao']} do formato, não suportada.")
+        seq = cabecalho.get("seq", 0)
+        for linha in f: # uma tarefa de cada vez: o documento nunca está todo em memória
+            registo = json.loads(linha)
+            if "t" in registo:
+                tarefas.append(construir(registo["t"]) if construir else registo["t"])
+            elif "h" in registo:
+                historico.append(registo["h"])
+    return tarefas, historico, seq
+
+def _maior_id(dados): # maior id numa tarefa (dict) e em toda a sua árvore de subtarefas
+    maior, pendentes = 0, [dados]
+    while pendentes:
+        t = pendentes.pop()
+        maior = max(maior, t.get("id") or 0)
+        pendentes.extend(t.get("subtarefas") or ())
+    return maior
+
+def _escrever_snapshot(caminho, tarefas, historico, seq, compacto=True, snapshot_mmap=False):
+    temporario = caminho + ".tmp"
+    snap = open(caminho + ".snap.tmp", "wb") if compacto and snapshot_mmap else None
+    tabela = []
+    with open(temporario, "w", encoding="utf-8") as f:
+        if compacto:
+            # proximo_id: o snapshot mmap só descodifica as tarefas quando são usadas, por isso os ids
+            # das subtarefas têm de ser conhecidos sem as ler
+            tarefas = list(tarefas)
+            proximo_id = max((_maior_id(t) for t in tarefas), default=0) + 1
+            f.write(json.dumps({"formato": FORMATO_COMPACTO, "versao": VERSAO_FORMATO, "seq": seq,
+                                "proximo_id": proximo_id}) + "\n")
+            if snap:
+                snap.write(bytes(CABECALHO_MMAP.size))
+            for t in tarefas:
+                texto = json.dumps(t, ensure_ascii=False, separators=(",", ":"))
+                f.write('{"t":' + texto + "}\n")
+                if snap: # o mesmo JSON, com a posição guardada na tabela
+                    dados = texto.encode("utf-8")
+                    tabela.append((t.get("id") if t.get("id") is not None else -1, snap.tell(), len(dados)))
+                    snap.write(dados)
+            historico = list(historico)
+            for h in historico:
+                f.write(json.dumps({"h": h}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        else:
+            json.dump({"tarefas": list(tarefas), "historico": list(historico), "seq": seq}, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno()) # o ficheiro temporário fica completo no disco antes de substituir o original
+    if snap:
+        with snap:
+            offset_historico = snap.tell()
+            snap.write(json.dumps(historico, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            offset_tabela = snap.tell()
+            for entrada in tabela:
+                snap.write(ENTRADA_MMAP.pack(*entrada))
+            snap.seek(0)
+            snap.write(CABECALHO_MMAP.pack(MAGIC_MMAP, seq, len(tabela), offset_historico, offset_tabela))
+            snap.flush()
+            os.fsync(snap.fileno())
+        try:
+            os.replace(caminho + ".snap.tmp", caminho + ".snap")
+        except OSError: # no Windows não se substitui um ficheiro mapeado por outro processo; fica desatualizado (seq diferente)
+            os.remove(caminho + ".snap.tmp")
+    os.replace(temporario, caminho)
+
+# Snapshot só de leitura para mmap ('<arquivo>.snap'), escrito ao lado do snapshot compacto:
+# cabeçalho | registos (JSON de cada tarefa) | histórico (JSON) | tabela (id, offset, tamanho) por tarefa.
+# Vários processos que abram a mesma lista partilham as páginas do ficheiro em vez de cada um a descodificar.
+MAGIC_MMAP = b"TARSNAP1"
+CABECALHO_MMAP = struct.Struct("<8sQIQQ") # magic, seq, número de tarefas, offset do histórico, offset da tabela
+ENTRADA_MMAP = struct.Struct("<qQI") # id (-1 se não tiver), offset, tamanho
+
+class SnapshotMmap:
+    def __init__(self, caminho):
+        with open(caminho, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.seq, self.n, self._offset_historico, self._offset_tabela = CABECALHO_MMAP.unpack_from(self._mm, 0)
+        if magic != MAGIC_MMAP:
+            self._mm.close()
+            raise ValueError(f"'{caminho}' não é um snapshot mmap.")
+
+    def __len__(self):
+        return self.n
+
+    def registo(self, i): # descodifica só a tarefa i
+        _, offset, tamanho = ENTRADA_MMAP.unpack_from(self._mm, self._offset_tabela + i * ENTRADA_MMAP.size)
+        return json.loads(self._mm[offset:offset + tamanho])
+
+    def ids(self):
+        fim = self._offset_tabela + self.n * ENTRADA_MMAP.size
+        return [tarefa_id for tarefa_id, _, _ in ENTRADA_MMAP.iter_unpack(self._mm[self._offset_tabela:fim])]
+
+    def historico(self):
+        return json.loads(self._mm[self._offset_historico:self._offset_tabela])
+
+# Tarefas, subtarefas, comentários e índices só são criados quando usados; na GUI podem ser pedidos ao mesmo
+# tempo pela thread do Tk e por um trabalhador, por isso cada um é criado uma só vez, com esta trava
+_TRAVA_PREGUICOSA = threading.RLock()
+
+class ListaTarefasMmap(MutableSequence):
+    # Lista de tarefas sobre um SnapshotMmap (ou TarefasSQLite): cada posição guarda o número do registo até ser acedida
+    def __init__(self, snapshot, construir=None):
+        self._snapshot = snapshot
+        self._construir = construir
+        self._itens = list(range(len(snapshot)))
+        self._ids = None
+
+    def _obter(self, i):
+        item = self._itens[i]
+        if type(item) is int:
+            with _TRAVA_PREGUICOSA: # duas threads não podem criar duas Tarefa para o mesmo registo
+                item = self._itens[i]
+                if type(item) is int:
+                    dados = self._snapshot.registo(item)
+                    item = self._itens[i] = self._construir(dados) if self._construir else dados
+        return item
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._obter(j) for j in range(*i.indices(len(self._itens)))]
+        return self._obter(i)
+
+    def __setitem__(self, i, valor):
+        self._itens[i] = valor
+
+    def __delitem__(self, i):
+        del self._itens[i]
+
+    def __len__(self):
+        return len(self._itens)
+
+    def __iter__(self):
+        for i in range(len(self._itens)):
+            yield self._obter(i)
+
+    def insert(self, i, valor):
+        self._itens.insert(i, valor)
+
+    def sort(self, key=None, reverse=False):
+        self._itens = sorted(self, key=key, reverse=reverse)
+
+    def ids(self): # ids sem descodificar as tarefas
+        if self._ids is None:
+            self._ids = self._snapshot.ids()
+        for item in self._itens:
+            yield self._ids[item] if type(item) is int else (item.get("id") if isinstance(item, dict) else item.id)
+
+    def para_dicts(self): # para gravar: as tarefas por descodificar não passam por objetos Tarefa
+        for item in self._itens:
+            yield self._snapshot.registo(item) if type(item) is int else (item if isinstance(item, dict) else item.to_dict())
+
+def _abrir_snapshot_mmap(arquivo_json):
+    # Só é usado se corresponder ao snapshot compacto atual (mesmo 'seq')
+    try:
+        with open(arquivo_json, "r", encoding="utf-8") as f:
+            cabecalho = json.loads(f.readline())
+        if not isinstance(cabecalho, dict) or cabecalho.get("formato") != FORMATO_COMPACTO \
+                or "proximo_id" not in cabecalho: # sem proximo_id os ids por ler não são conhecidos: leitura normal
+            return None
+        snapshot = SnapshotMmap(arquivo_json + ".snap")
+    except (OSError, ValueError, struct.error):
+        return None
+    if snapshot.seq != cabecalho.get("seq", 0):
+        return None
+    snapshot.proximo_id = cabecalho["proximo_id"]
+    return snapshot
+
+
+def _prioridade(tarefa): # dict (snapshot/journal) ou Tarefa
+    return tarefa.get("prioridade") if isinstance(tarefa, dict) else tarefa.prioridade
+
+# Journal: cada alteração é acrescentada como uma linha JSON em '<arquivo>.journal'
+def _aplicar_operacao(tarefas, historico, op, construir=None): # aplica um registo do journal
+    tipo = op["op"]
+    if tipo == "inserir":
+        tarefas.insert(op["indice"], construir(op["tarefa"]) if construir else op["tarefa"])
+    elif tipo == "atualizar":
+        tarefas[op["indice"]] = construir(op["tarefa"]) if construir else op["tarefa"]
+    elif tipo == "remover":
+        tarefas.pop(op["indice"])
+    elif tipo == "ordenar": # journals antigos: listar_tarefas reordenava a lista guardada
+        tarefas.sort(key=lambda x: PRIORIDADE_ORDEM.get(_prioridade(x), 4))
+    elif tipo == "historico":
+        historico.append(op["entrada"])
+        if op.get("limite"):
+            del historico[:-op["limite"]] # histórico limitado
+    elif tipo == "desfazer":
+        if historico:
+            historico.pop()
+
+def _ler_journal(caminho, seq_minima):
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    op = json.loads(linha)
+                except json.JSONDecodeError:
+                    break  # última linha incompleta (escrita interrompida)
+                if op.get("seq", 0) > seq_minima:
+                    yield op
+    except FileNotFoundError:
+        return
+
+def _compactar_journal(arquivo_json, arquivo_rodado, lock, compacto, snapshot_mmap):
+    # Corre numa thread: junta snapshot + journal rodado e reescreve o snapshot sem tocar nos objetos em memória
+    with lock:
+        tarefas, historico, seq = _ler_snapshot(arquivo_json)
+        for op in _ler_journal(arquivo_rodado, seq):
+            _aplicar_operacao(tarefas, historico, op)
+            seq = op["seq"]
+        _escrever_snapshot(arquivo_json, tarefas, historico, seq, compacto, snapshot_mmap)
+        if os.path.exists(arquivo_rodado): # salvar() pode já o ter descartado
+            os.remove(arquivo_rodado)
+
+# Motores de armazenamento do GestorTarefas. Todos trabalham com dicts (Tarefa.to_dict) e expõem:
+#   carregar(construir=None) -> (tarefas, historico) | registar(operacoes) | salvar(tarefas, historico) | fechar()
+# 'construir' (ex.: Tarefa.from_dict) é aplicado a cada tarefa à medida que é lida.
+# 'incremental' indica se registar() grava sozinho ou se o gestor tem de chamar salvar().
+class ArmazenamentoJSON:
+    def __init__(self, arquivo_json, usar_journal=True, limite_journal=LIMITE_JOURNAL, compacto=True, snapshot_mmap=True):
+        self.arquivo_json = arquivo_json
+        self.incremental = usar_journal # False = reescreve o JSON completo a cada alteração
+        self.compacto = compacto # False = grava no formato antigo (JSON indentado)
+        self.snapshot_mmap = snapshot_mmap # também grava '<arquivo>.snap' e usa-o para arrancar
+        self.limite_journal = limite_journal
+        self.arquivo_journal = arquivo_json + ".journal"
+        self._seq = 0 # número do último registo aplicado
+        self.proximo_id = 0 # id livre indicado pelo snapshot (0 = as tarefas lidas indicam os seus ids)
+        self._lock_snapshot = threading.Lock()
+        self._thread_compactacao = None
+
+    def carregar(self, construir=None):
+        snapshot = _abrir_snapshot_mmap(self.arquivo_json) if self.snapshot_mmap else None
+        self.proximo_id = 0
+        if snapshot: # as tarefas só são descodificadas quando acedidas
+            tarefas, historico, self._seq = ListaTarefasMmap(snapshot, construir), snapshot.historico(), snapshot.seq
+            self.proximo_id = snapshot.proximo_id
+        else:
+            tarefas, historico, self._seq = _ler_snapshot(self.arquivo_json, construir)
+        # Reaplicar as alterações registadas depois do último snapshot (journal rodado primeiro)
+        for caminho in (self.arquivo_journal + ".1", self.arquivo_journal):
+            for op in _ler_journal(caminho, self._seq):
+                _aplicar_operacao(tarefas, historico, op, construir)
+                self._seq = op["seq"]
+        return tarefas, historico
+
+    def registar(self, operacoes):
+        linhas = []
+        for op in operacoes:
+            self._seq += 1
+            op["seq"] = self._seq
+            linhas.append(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n")
+        with open(self.arquivo_journal, "a", encoding="utf-8") as f:
+            f.writelines(linhas)
+        if os.path.getsize(self.arquivo_journal) > self.limite_journal:
+            self._iniciar_compactacao()
+
+    def _iniciar_compactacao(self):
+        if self._thread_compactacao and self._thread_compactacao.is_alive():
+            return
+        arquivo_rodado = self.arquivo_journal + ".1"
+        if not os.path.exists(arquivo_rodado): # se existir, é de uma compactação falhada: compacta-se esse primeiro
+            os.replace(self.arquivo_journal, arquivo_rodado)
+        self._thread_compactacao = threading.Thread(
+            target=_compactar_journal, args=(self.arquivo_json, arquivo_rodado, self._lock_snapshot, self.compacto, self.snapshot_mmap),
+            daemon=True)
+        self._thread_compactacao.start()
+
+    def aguardar_compactacao(self):
+        if self._thread_compactacao:
+            self._thread_compactacao.join()
+
+    def salvar(self, tarefas, historico): # reescreve o snapshot completo e descarta o journal
+        with self._lock_snapshot:
+            _escrever_snapshot(self.arquivo_json, tarefas, historico, self._seq, self.compacto, self.snapshot_mmap)
+            for caminho in (self.arquivo_journal + ".1", self.arquivo_journal):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+    def fechar(self):
+        self.aguardar_compactacao()
+
+class ArmazenamentoSQLite:
+    # Tabelas normalizadas, com índices por prioridade, prazo, estado e etiqueta. Ao abrir só se leem os ids das
+    # tarefas principais (cada tarefa é lida quando é usada); a listagem, as páginas, o filtro por etiqueta e
+    # consultar() correm em SQL. A janela, os duplicados e as pesquisas de texto e de prazos usam os índices
+    # em memória e continuam a ler todas as tarefas.
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY,
+            uid INTEGER, -- Tarefa.id
+            pai INTEGER REFERENCES tarefas(id) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL,
+            titulo TEXT NOT NULL,
+            prioridade TEXT NOT NULL,
+            prazo TEXT,
+            recorrencia TEXT,
+            concluida INTEGER NOT NULL DEFAULT 0,
+            origem INTEGER -- Tarefa.origem (ocorrência de uma recorrente)
+        );
+        CREATE TABLE IF NOT EXISTS etiquetas (
+            tarefa_id INTEGER NOT NULL REFERENCES tarefas(id) ON DELETE CASCADE,
+            etiqueta TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS comentarios (
+            tarefa_id INTEGER NOT NULL REFERENCES tarefas(id) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL,
+            texto TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS historico (
+            posicao INTEGER PRIMARY KEY,
+            acao TEXT NOT NULL,
+            tarefa_uid INTEGER, -- tarefa ainda na lista (adicionar/concluir)
+            antes TEXT, -- valores anteriores, em JSON
+            indice INTEGER,
+            tarefa TEXT -- corpo da tarefa removida (única cópia)
+        );
+        CREATE INDEX IF NOT EXISTS idx_tarefas_pai_posicao ON tarefas(pai, posicao);
+        CREATE INDEX IF NOT EXISTS idx_tarefas_uid ON tarefas(uid);
+        CREATE INDEX IF NOT EXISTS idx_tarefas_prioridade ON tarefas(prioridade);
+        CREATE INDEX IF NOT EXISTS idx_tarefas_prazo ON tarefas(prazo);
+        CREATE INDEX IF NOT EXISTS idx_tarefas_concluida ON tarefas(concluida);
+        CREATE INDEX IF NOT EXISTS idx_etiquetas_etiqueta ON etiquetas(etiqueta, tarefa_id);
+        CREATE INDEX IF NOT EXISTS idx_etiquetas_tarefa ON etiquetas(tarefa_id);
+        CREATE INDEX IF NOT EXISTS idx_comentarios_tarefa ON comentarios(tarefa_id, posicao);
+    """
+    RANK_PRIORIDADE = "CASE prioridade WHEN 'Alta' THEN 1 WHEN 'Média' THEN 2 WHEN 'Baixa' THEN 3 ELSE 4 END"
+    ARVORE = """WITH RECURSIVE arvore(id) AS (
+        SELECT id FROM tarefas WHERE pai IS NULL AND uid = ?
+        UNION ALL SELECT t.id FROM tarefas t JOIN arvore a ON t.pai = a.id)"""
+
+    def __init__(self, arquivo_db):
+        self.arquivo_db = arquivo_db
+        self.incremental = True
+        import sqlite3 # só carregado quando se usa a base de dados
+        self.con = sqlite3.connect(arquivo_db, check_same_thread=False)
+        self._lock = threading.RLock() # a ligação é partilhada com a thread do GravadorAutomatico
+        self.con.execute("PRAGMA foreign_keys = ON")
+        self.con.executescript(self.ESQUEMA)
+        if "origem" not in {linha[1] for linha in self.con.execute("PRAGMA table_info(tarefas)")}: # base de dados antiga
+            self.con.execute("ALTER TABLE tarefas ADD COLUMN origem INTEGER")
+
+    def _inserir_arvore(self, dados, pai, posicao):
+        cur = self.con.execute(
+            "INSERT INTO tarefas (uid, pai, posicao, titulo, prioridade, prazo, recorrencia, concluida, origem) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (dados.get("id"), pai, posicao, dados.get("titulo") or "Tarefa sem título", dados.get("prioridade") or "Média",
+             dados.get("prazo"), dados.get("recorrencia"), int(bool(dados.get("concluida"))), dados.get("origem")))
+        tarefa_id = cur.lastrowid
+        self.con.executemany("INSERT INTO etiquetas (tarefa_id, etiqueta) VALUES (?, ?)",
+                             [(tarefa_id, e) for e in dados.get("etiquetas") or []])
+        self.con.executemany("INSERT INTO comentarios (tarefa_id, posicao, texto) VALUES (?, ?, ?)",
+                             [(tarefa_id, i, c) for i, c in enumerate(dados.get("comentarios") or [])])
+        for i, sub in enumerate(dados.get("subtarefas") or []):
+            self._inserir_arvore(sub, tarefa_id, i)
+
+    def _id_na_posicao(self, posicao):
+        linha = self.con.execute("SELECT id FROM tarefas WHERE pai IS NULL AND posicao = ?", (posicao,)).fetchone()
+        return linha[0] if linha else None
+
+    def _aplicar(self, op):
+        tipo = op["op"]
+        if tipo == "inserir":
+            self.con.execute("UPDATE tarefas SET posicao = posicao + 1 WHERE pai IS NULL AND posicao >= ?", (op["indice"],))
+            self._inserir_arvore(op["tarefa"], None, op["indice"])
+        elif tipo == "atualizar":
+            self.con.execute("DELETE FROM tarefas WHERE id = ?", (self._id_na_posicao(op["indice"]),))
+            self._inserir_arvore(op["tarefa"], None, op["indice"])
+        elif tipo == "remover":
+            self.con.execute("DELETE FROM tarefas WHERE id = ?", (self._id_na_posicao(op["indice"]),))
+            self.con.execute("UPDATE tarefas SET posicao = posicao - 1 WHERE pai IS NULL AND posicao > ?", (op["indice"],))
+        elif tipo == "ordenar":
+            self.con.execute(f"""
+                WITH nova AS (SELECT id, ROW_NUMBER() OVER (ORDER BY {self.RANK_PRIORIDADE}, posicao) - 1 AS posicao
+                              FROM tarefas WHERE pai IS NULL)
+                UPDATE tarefas SET posicao = (SELECT nova.posicao FROM nova WHERE nova.id = tarefas.id)
+                WHERE pai IS NULL""")
+        elif tipo == "historico":
+            entrada = op["entrada"]
+            self.con.execute(
+                "INSERT INTO historico (posicao, acao, tarefa_uid, antes, indice, tarefa) VALUES ((SELECT COALESCE(MAX(posicao), -1) + 1 FROM historico), ?, ?, ?, ?, ?)",
+                (entrada["acao"], entrada.get("id"), json.dumps(entrada["antes"]) if "antes" in entrada else None, entrada.get("indice"),
+                 json.dumps(entrada["tarefa"], ensure_ascii=False) if "tarefa" in entrada else None))
+            if op.get("limite"):
+                self.con.execute("DELETE FROM historico WHERE posicao <= (SELECT MAX(posicao) FROM historico) - ?", (op["limite"],))
+        elif tipo == "desfazer":
+            self.con.execute("DELETE FROM historico WHERE posicao = (SELECT MAX(posicao) FROM historico)")
+
+    def registar(self, operacoes):
+        with self._lock, self.con: # uma transação por lote de alterações
+            for op in operacoes:
+                self._aplicar(op)
+
+    def salvar(self, tarefas, historico):
+        with self._lock, self.con:
+            self.con.execute("DELETE FROM tarefas")
+            self.con.execute("DELETE FROM historico")
+            for i, t in enumerate(tarefas):
+                self._inserir_arvore(t, None, i)
+            for h in historico:
+                self._aplicar({"op": "historico", "entrada": h})
+
+    def carregar(self, construir=None):
+        with self._lock:
+            return self._carregar(construir)
+
+    def _carregar(self, construir):
+        # Só se leem os ids das tarefas principais: cada árvore é lida da base de dados quando é acedida
+        uids = [linha[0] for linha in self.con.execute("SELECT uid FROM tarefas WHERE pai IS NULL ORDER BY posicao")]
+        self.proximo_id = (self.con.execute("SELECT MAX(uid) FROM tarefas").fetchone()[0] or 0) + 1
+        if None in uids: # dados de uma versão sem identificadores: lidos de uma vez para os ids serem atribuídos
+            tarefas = self._ler_arvores()
+            if construir:
+                tarefas = [construir(t) for t in tarefas]
+        else:
+            tarefas = ListaTarefasMmap(TarefasSQLite(self, uids), construir)
+        historico = []
+        for acao, uid, antes, indice, tarefa in self.con.execute(
+                "SELECT acao, tarefa_uid, antes, indice, tarefa FROM historico ORDER BY posicao"):
+            entrada = {"acao": acao}
+            if uid is not None:
+                entrada["id"] = uid
+            if antes is not None:
+                entrada["antes"] = json.loads(antes)
+            if indice is not None:
+                entrada["indice"] = indice
+            if tarefa is not None:
+                entrada["tarefa"] = json.loads(tarefa)
+            historico.append(entrada)
+        return tarefas, historico
+
+    def ler_tarefa(self, uid): # dict da tarefa principal com esse id, com as subtarefas
+        with self._lock:
+            return self._ler_arvores(uid)[0]
+
+    def _ler_arvores(self, uid=None): # dicts das tarefas principais (todas ou só a de um uid), pela ordem da lista
+        cte, filtro, parametros = ("", "1", ()) if uid is None else (self.ARVORE, "{} IN (SELECT id FROM arvore)", (uid,))
+        etiquetas, comentarios, filhos = {}, {}, {}
+        for tarefa_id, etiqueta in self.con.execute(
+                f"{cte} SELECT tarefa_id, etiqueta FROM etiquetas WHERE {filtro.format('tarefa_id')} ORDER BY rowid", parametros):
+            etiquetas.setdefault(tarefa_id, []).append(etiqueta)
+        for tarefa_id, texto in self.con.execute(
+                f"{cte} SELECT tarefa_id, texto FROM comentarios WHERE {filtro.format('tarefa_id')} ORDER BY tarefa_id, posicao",
+                parametros):
+            comentarios.setdefault(tarefa_id, []).append(texto)
+        linhas = self.con.execute(
+            f"{cte} SELECT id, pai, uid, titulo, prioridade, prazo, recorrencia, concluida, origem FROM tarefas "
+            f"WHERE {filtro.format('id')} ORDER BY pai, posicao", parametros).fetchall()
+        por_id = {}
+        for tarefa_id, pai, uid, titulo, prioridade, prazo, recorrencia, concluida, origem in linhas:
+            dados = por_id[tarefa_id] = {
+                "id": uid,
+                "titulo": titulo,
+                "prioridade": prioridade,
+                "etiquetas": etiquetas.get(tarefa_id, []),
+                "prazo": prazo,
+                "recorrencia": recorrencia,
+                "comentarios": comentarios.get(tarefa_id, []),
+                "subtarefas": filhos.setdefault(tarefa_id, []),
+                "concluida": bool(concluida)
+            }
+            if origem is not None:
+                dados["origem"] = origem
+        tarefas = []
+        for tarefa_id, pai, *_ in linhas:
+            (tarefas if pai is None else filhos.setdefault(pai, [])).append(por_id[tarefa_id])
+        return tarefas
+
+    def filtrar_posicoes(self, etiqueta=None, prioridade=None, concluida=None, prazo_ate=None, consulta=None):
+        # Posições das tarefas principais que cumprem os filtros, pela ordem da listagem (prioridade, prazo, posição).
+        # De uma Consulta usam-se os critérios que o SQL resolve; recorrência e texto ficam para Consulta.aceita.
+        condicoes, parametros = ["t.pai IS NULL"], []
+        if etiqueta:
+            condicoes.append("EXISTS (SELECT 1 FROM etiquetas e WHERE e.tarefa_id = t.id AND e.etiqueta = ?)")
+            parametros.append(etiqueta)
+        if prioridade:
+            condicoes.append("t.prioridade = ?")
+            parametros.append(prioridade)
+        if concluida is not None:
+            condicoes.append("t.concluida = ?")
+            parametros.append(int(concluida))
+        if prazo_ate:
+            condicoes.append("t.prazo IS NOT NULL AND t.prazo <= ?")
+            parametros.append(prazo_ate.strftime("%Y-%m-%d"))
+        if consulta is not None:
+            if consulta.prioridades:
+                condicoes.append(f"t.prioridade IN ({', '.join('?' * len(consulta.prioridades))})")
+                parametros.extend(consulta.prioridades)
+            if consulta.etiquetas:
+                marcas = ", ".join("?" * len(consulta.etiquetas))
+                if consulta.todas_etiquetas:
+                    condicoes.append(f"(SELECT COUNT(DISTINCT e.etiqueta) FROM etiquetas e "
+                                     f"WHERE e.tarefa_id = t.id AND e.etiqueta IN ({marcas})) = ?")
+                    parametros.extend(consulta.etiquetas + [len(consulta.etiquetas)])
+                else:
+                    condicoes.append(f"EXISTS (SELECT 1 FROM etiquetas e WHERE e.tarefa_id = t.id AND e.etiqueta IN ({marcas}))")
+                    parametros.extend(consulta.etiquetas)
+            if consulta.prazo_de is not None:
+                condicoes.append("t.prazo >= ?")
+                parametros.append(datetime.fromordinal(consulta.prazo_de).strftime("%Y-%m-%d"))
+            if consulta.prazo_ate is not None:
+                condicoes.append("t.prazo <= ?")
+                parametros.append(datetime.fromordinal(consulta.prazo_ate).strftime("%Y-%m-%d"))
+            if consulta.concluida is not None:
+                condicoes.append("t.concluida = ?")
+                parametros.append(int(consulta.concluida))
+        sql = (f"SELECT t.posicao FROM tarefas t WHERE {' AND '.join(condicoes)} "
+               f"ORDER BY {self.RANK_PRIORIDADE}, t.prazo IS NULL, t.prazo, t.posicao")
+        with self._lock:
+            return [linha[0] for linha in self.con.execute(sql, parametros)]
+
+    def fechar(self):
+        with self._lock:
+            self.con.close()
+
+def migrar_para_sqlite(arquivo_json, arquivo_db): # importa BaseDados.json / tarefas.json (incluindo o journal)
+    tarefas, historico = ArmazenamentoJSON(arquivo_json).carregar()
+    tarefas = [Tarefa.from_dict(t, preguicoso=True).to_dict() for t in tarefas] # garante os ids
+    destino = ArmazenamentoSQLite(arquivo_db)
+    destino.salvar(tarefas, historico)
+    destino.fechar()
+    print(f"Migradas {len(tarefas)} tarefas e {len(historico)} ações do histórico de '{arquivo_json}' para '{arquivo_db}'.")
+
+class TarefasSQLite:
+    # Tarefas principais de uma base SQLite para ListaTarefasMmap: cada registo é lido pelo id persistente (uid),
+    # que não muda quando outras tarefas são inseridas, removidas ou reordenadas nem quando a base é regravada
+    def __init__(self, armazenamento, uids):
+        self._armazenamento = armazenamento
+        self._uids = uids
+
+    def __len__(self):
+        return len(self._uids)
+
+    def registo(self, i):
+        return self._armazenamento.ler_tarefa(self._uids[i])
+
+    def ids(self):
+        return list(self._uids)
+
+# Escrita em segundo plano: as alterações agendadas são juntadas e gravadas numa só escrita
+# depois de 'atraso' segundos sem novas alterações. O estado completo (snapshot) é copiado para dicts
+# na thread que altera as tarefas (agendar/flush): a thread de escrita nunca percorre a lista nem o histórico.
+class GravadorAutomatico:
+    def __init__(self, armazenamento, obter_dados, atraso=ATRASO_AUTOSAVE):
+        self.armazenamento = armazenamento
+        self.obter_dados = obter_dados # () -> (tarefas, historico) em dicts; chamado na thread que altera as tarefas
+        self.atraso = atraso
+        self._operacoes = [] # operações do journal posteriores ao snapshot por gravar
+        self._snapshot = None # (tarefas, historico) já copiados, por gravar
+        self._snapshot_pedido = False # é preciso copiar o estado completo (motor não incremental ou escrita falhada)
+        self._ultima_alteracao = 0.0
+        self._a_escrever = False
+        self._forcar = False
+        self._terminar = False
+        self._erro = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._ciclo, name="gravador-tarefas", daemon=True)
+        self._thread.start()
+
+    def agendar(self, operacoes):
+        with self._cond:
+            if self.armazenamento.incremental:
+                self._operacoes.extend(operacoes)
+            else:
+                self._snapshot_pedido = True
+        self._preparar_snapshot()
+        with self._cond:
+            self._ultima_alteracao = time.monotonic()
+            self._cond.notify_all()
+
+    def _preparar_snapshot(self): # na thread que altera as tarefas
+        with self._cond:
+            if not self._snapshot_pedido:
+                return
+            self._snapshot_pedido = False
+        dados = self.obter_dados()
+        with self._cond:
+            self._snapshot = dados
+            self._operacoes = [] # o snapshot já as inclui
+
+    def _pendente(self): # há alguma coisa que a thread de escrita possa gravar
+        # depois de uma falha espera-se pelo snapshot pedido (o journal pode ter ficado a meio)
+        return self._snapshot is not None or (bool(self._operacoes) and not self._snapshot_pedido)
+
+    def _gravar(self, snapshot, operacoes): # devolve o erro, se houver
+        try:
+            if snapshot is not None:
+                self.armazenamento.salvar(*snapshot)
+            if operacoes:
+                self.armazenamento.registar(operacoes)
+        except Exception as e:
+            return e
+        return None
+
+    def _retirar(self): # o que há para gravar (com self._cond)
+        operacoes, self._operacoes = self._operacoes, []
+        snapshot, self._snapshot = self._snapshot, None
+        return snapshot, operacoes
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                while not self._pendente() and not self._terminar:
+                    self._cond.wait()
+                if not self._pendente():
+                    return # terminar sem nada por gravar
+                while not (self._forcar or self._terminar): # esperar pelo período sem alterações
+                    restante = self._ultima_alteracao + self.atraso - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                snapshot, operacoes = self._retirar()
+                self._a_escrever = True
+            erro = self._gravar(snapshot, operacoes)
+            with self._cond:
+                self._a_escrever = False
+                self._erro = erro # relatado no próximo flush()
+                if erro: # nada se perde: o próximo agendar/flush copia de novo o estado completo
+                    self._snapshot_pedido = True
+                self._cond.notify_all()
+
+    def flush(self): # bloqueia até tudo o que foi agendado estar gravado
+        self._preparar_snapshot()
+        with self._cond:
+            if self._terminar or not self._thread.is_alive(): # a thread já terminou: grava nesta
+                erro = self._gravar(*self._retirar())
+                if erro:
+                    self._snapshot_pedido = True
+            else:
+                self._forcar = True
+                self._erro = None # o que falhou antes é tentado agora
+                self._cond.notify_all()
+                while (self._pendente() or self._a_escrever) and self._erro is None:
+                    self._cond.wait()
+                self._forcar = False
+                erro, self._erro = self._erro, None
+        if erro:
+            raise erro
+
+    def fechar(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._terminar = True
+                self._cond.notify_all()
+            self._thread.join()
+
+def normalizar_titulo(titulo): # 'Reunião Média' e 'reuniao media' dão a mesma chave
+    if titulo.isascii(): # caso comum: não há acentos para retirar
+        return titulo.strip().lower()
+    decomposto = unicodedata.normalize("NFKD", titulo.strip().casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+def palavras_texto(texto): # palavras normalizadas (sem acentos nem maiúsculas), sem as palavras vazias
+    return [p for p in re.findall(r"\w+", normalizar_titulo(texto)) if p not in PALAVRAS_VAZIAS]
+
+class IndiceTexto:
+    # Índice invertido das palavras dos títulos, comentários e subtarefas, com pesquisa por prefixo
+    def __init__(self, tarefas=()):
+        self._ocorrencias = {}  # palavra -> {id: peso}
+        self._palavras_de = {}  # id -> {palavra: peso} indexado (para atualizar só a diferença)
+        self._tarefas = {}  # id -> tarefa
+        self._vocabulario = None  # palavras ordenadas para os prefixos (ordenadas uma vez no fim da construção)
+        for tarefa in tarefas:
+            self.atualizar(tarefa)
+        self._vocabulario = sorted(self._ocorrencias)
+
+    @staticmethod
+    def _palavras(tarefa):
+        palavras = {}
+        for texto, campo in tarefa.textos():
+            peso = PESOS_TEXTO[campo]
+            for palavra in palavras_texto(texto):
+                palavras[palavra] = palavras.get(palavra, 0) + peso
+        return palavras
+
+    def atualizar(self, tarefa): # também serve para adicionar
+        antigas = self._palavras_de.get(tarefa.id, {})
+        novas = self._palavras(tarefa)
+        self._tarefas[tarefa.id] = tarefa
+        if novas == antigas:
+            return
+        for palavra in antigas.keys() - novas.keys():
+            self._retirar(palavra, tarefa.id)
+        for palavra, peso in novas.items():
+            grupo = self._ocorrencias.get(palavra)
+            if grupo is None:
+                grupo = self._ocorrencias[palavra] = {}
+                if self._vocabulario is not None:
+                    bisect.insort(self._vocabulario, palavra)
+            grupo[tarefa.id] = peso
+        self._palavras_de[tarefa.id] = novas
+
+    adicionar = atualizar
+
+    def remover(self, tarefa):
+        for palavra in self._palavras_de.pop(tarefa.id, {}):
+            self._retirar(palavra, tarefa.id)
+        self._tarefas.pop(tarefa.id, None)
+
+    def _retirar(self, palavra, tarefa_id):
+        grupo = self._ocorrencias[palavra]
+        del grupo[tarefa_id]
+        if not grupo:
+            del self._ocorrencias[palavra]
+            if self._vocabulario is not None:
+                del self._vocabulario[bisect.bisect_left(self._vocabulario, palavra)]
+
+    def _com_prefixo(self, prefixo):
+        i = bisect.bisect_left(self._vocabulario, prefixo)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(prefixo):
+            yield self._vocabulario[i]
+            i += 1
+
+    def pesquisar(self, texto, limite=None): # [(tarefa, pontuação)], as mais relevantes primeiro
+        pontuacoes = None
+        for palavra in palavras_texto(texto): # todas as palavras têm de aparecer (como palavra ou prefixo)
+            parcial = {}
+            for termo in self._com_prefixo(palavra):
+                fator = 2 if termo == palavra else 1 # a palavra inteira vale mais do que um prefixo
+                for tarefa_id, peso in self._ocorrencias[termo].items():
+                    parcial[tarefa_id] = parcial.get(tarefa_id, 0) + peso * fator
+            if pontuacoes is None:
+                pontuacoes = parcial
+            else:
+                pontuacoes = {tid: p + parcial[tid] for tid, p in pontuacoes.items() if tid in parcial}
+            if not pontuacoes:
+                return []
+        if not pontuacoes:
+            return []
+        chave = lambda item: (-item[1], item[0])
+        melhores = heapq.nsmallest(limite, pontuacoes.items(), key=chave) if limite else sorted(pontuacoes.items(), key=chave)
+        return [(self._tarefas[tarefa_id], pontos) for tarefa_id, pontos in melhores]
+
+class IndiceTitulos:
+    # Índice título normalizado -> tarefas, para detetar duplicados sem percorrer a lista
+    def __init__(self, tarefas=()):
+        self._por_chave = {}  # chave -> {id: tarefa}
+        self._chave_de = {}  # id -> chave indexada
+        self._duplicadas = set()  # chaves com mais de uma tarefa
+        for tarefa in tarefas:
+            self.adicionar(tarefa)
+
+    def adicionar(self, tarefa):
+        if tarefa.origem is not None: # registo de uma ocorrência: repete o título da modelo de propósito
+            return
+        chave = self._chave_de[tarefa.id] = normalizar_titulo(tarefa.titulo)
+        grupo = self._por_chave.setdefault(chave, {})
+        grupo[tarefa.id] = tarefa
+        if len(grupo) > 1:
+            self._duplicadas.add(chave)
+
+    def remover(self, tarefa):
+        chave = self._chave_de.pop(tarefa.id, None)
+        if chave is None:
+            return
+        grupo = self._por_chave[chave]
+        del grupo[tarefa.id]
+        if len(grupo) < 2:
+            self._duplicadas.discard(chave)
+        if not grupo:
+            del self._por_chave[chave]
+
+    def atualizar(self, tarefa): # só mexe no índice se o título mudou
+        if self._chave_de.get(tarefa.id) != normalizar_titulo(tarefa.titulo):
+            self.remover(tarefa)
+            self.adicionar(tarefa)
+
+    def procurar(self, titulo): # tarefas com o mesmo título normalizado
+        return list(self._por_chave.get(normalizar_titulo(titulo), {}).values())
+
+    def grupos_duplicados(self):
+        return [list(self._por_chave[chave].values()) for chave in self._duplicadas]
+
+class VistaOrdenada:
+    # Tarefas ordenadas por uma chave, numa lista mantida com bisect a cada alteração
+    # (as subclasses definem _chave; chave None = a tarefa fica de fora)
+    def __init__(self, tarefas=()):
+        self._contador = itertools.count()
+        self._chave_de = {}  # id -> chave atual
+        self._por_chave = {}  # chave -> tarefa
+        for tarefa in tarefas:
+            chave = self._chave(tarefa, next(self._contador))
+            if chave is not None:
+                self._chave_de[tarefa.id] = chave
+                self._por_chave[chave] = tarefa
+        self._chaves = sorted(self._por_chave)
+
+    def _chave(self, tarefa, ordem): # a ordem de inserção desempata e torna a chave única
+        raise NotImplementedError
+
+    def adicionar(self, tarefa, ordem=None):
+        chave = self._chave(tarefa, next(self._contador) if ordem is None else ordem)
+        if chave is None:
+            return
+        self._chave_de[tarefa.id] = chave
+        self._por_chave[chave] = tarefa
+        bisect.insort(self._chaves, chave)
+
+    def remover(self, tarefa):
+        chave = self._chave_de.pop(tarefa.id, None)
+        if chave is None:
+            return
+        del self._chaves[bisect.bisect_left(self._chaves, chave)]
+        del self._por_chave[chave]
+
+    def atualizar(self, tarefa): # só reposiciona se a chave mudou (mantém a ordem de inserção)
+        chave = self._chave_de.get(tarefa.id)
+        ordem = chave[-1] if chave is not None else None
+        if chave is None or chave != self._chave(tarefa, ordem):
+            self.remover(tarefa)
+            self.adicionar(tarefa, ordem)
+
+    def primeiras(self, n=None): # as n primeiras tarefas (todas se n for None)
+        return [self._por_chave[chave] for chave in self._chaves[:n]]
+
+    def ordenar(self, tarefas): # ordena um subconjunto (ex.: resultado de um filtro) pelas chaves já calculadas
+        return sorted(tarefas, key=lambda t: self._chave_de[t.id])
+
+    def _fatia(self, inicio, fim): # chaves com inicio <= chave < fim (tuplos-prefixo, ex.: (prazo,))
+        return bisect.bisect_left(self._chaves, inicio), bisect.bisect_left(self._chaves, fim)
+
+    def contar(self, inicio, fim): # tamanho de um intervalo sem o percorrer
+        i, j = self._fatia(inicio, fim)
+        return j - i
+
+    def intervalo(self, inicio, fim):
+        return self.fatia(*self._fatia(inicio, fim))
+
+    def fatia(self, i, j): # tarefas entre as posições i e j da ordem
+        return [self._por_chave[chave] for chave in self._chaves[i:j]]
+
+    def posicao(self, chave): # posição de uma chave (ou de onde estaria, se já foi removida)
+        return bisect.bisect_left(self._chaves, chave)
+
+    def chave_na(self, posicao):
+        return self._chaves[posicao]
+
+    def __len__(self):
+        return len(self._chaves)
+
+class OrdemPrioridade(VistaOrdenada):
+    # Ordem da listagem: prioridade, prazo, ordem de inserção; não mexe na ordem de GestorTarefas.tarefas
+    SEM_PRAZO = float("inf")
+
+    def _chave(self, tarefa, ordem):
+        prazo = tarefa.prazo_ordinal
+        return (PRIORIDADE_ORDEM.get(tarefa.prioridade, 4), self.SEM_PRAZO if prazo is None else prazo, ordem)
+
+class ListagemPorIds(Sequence):
+    # Resultado de um filtro feito pelo motor: só guarda os ids e lê as tarefas de cada página quando é mostrada
+    def __init__(self, ids, obter):
+        self._ids = ids
+        self._obter = obter
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): # as que entretanto foram removidas ficam de fora
+            return [t for t in map(self._obter, self._ids[i]) if t is not None]
+        return self._obter(self._ids[i])
+
+class Paginador:
+    # Percorre uma listagem página a página. Sobre uma VistaOrdenada o cursor é a chave da primeira linha
+    # (tarefas acrescentadas ou removidas noutras páginas não a deslocam); sobre uma lista filtrada, a posição.
+    def __init__(self, fonte, tamanho=TAMANHO_PAGINA):
+        self._fonte = fonte
+        self._vista = isinstance(fonte, VistaOrdenada)
+        self.tamanho = max(1, int(tamanho))
+        self._cursor = None if self._vista else 0
+
+    @property
+    def total(self):
+        return len(self._fonte)
+
+    @property
+    def total_paginas(self):
+        return max(1, -(-self.total // self.tamanho))
+
+    @property
+    def numero(self):
+        return self._inicio() // self.tamanho + 1
+
+    def _inicio(self):
+        if self._vista:
+            inicio = 0 if self._cursor is None else self._fonte.posicao(self._cursor)
+        else:
+            inicio = self._cursor
+        return min(inicio, (self.total_paginas - 1) * self.tamanho) # a lista pode ter encolhido
+
+    def _ir(self, inicio):
+        inicio = max(0, min(inicio, (self.total_paginas - 1) * self.tamanho))
+        if self._vista:
+            self._cursor = self._fonte.chave_na(inicio) if inicio < self.total else None
+        else:
+            self._cursor = inicio
+
+    def pagina(self):
+        inicio = self._inicio()
+        if self._vista:
+            return self._fonte.fatia(inicio, inicio + self.tamanho)
+        return self._fonte[inicio:inicio + self.tamanho]
+
+    def seguinte(self):
+        self._ir(self._inicio() + self.tamanho)
+
+    def anterior(self):
+        self._ir(self._inicio() - self.tamanho)
+
+    def ir_para(self, numero): # número da página, a começar em 1
+        self._ir((numero - 1) * self.tamanho)
+
+class IndicePrazos(VistaOrdenada):
+    # Tarefas com prazo ordenadas por data; os limites de "atrasada"/"prazo próximo" só mudam uma vez por dia
+    DIAS_PROXIMO = 3
+
+    def __init__(self, tarefas=()):
+        super().__init__(tarefas)
+        self._dia = None
+        self._limites = None
+
+    def _chave(self, tarefa, ordem):
+        prazo = tarefa.prazo_ordinal
+        return None if prazo is None else (prazo, ordem)
+
+    def limites(self): # (hoje, último dia de "prazo próximo") como ordinais, recalculados quando o dia muda
+        hoje = datetime.now().toordinal()
+        if hoje != self._dia:
+            self._dia, self._limites = hoje, (hoje, hoje + self.DIAS_PROXIMO)
+        return self._limites
+
+    def classificar(self, tarefa): # 'atrasada', 'proxima' ou None; serve também para subtarefas
+        prazo = tarefa.prazo_ordinal
+        if prazo is None:
+            return None
+        hoje, limite = self.limites()
+        if prazo < hoje:
+            return "atrasada"
+        return "proxima" if prazo <= limite else None
+
+    def entre(self, inicio, fim): # ordinais, inclusive
+        return self.intervalo((inicio,), (fim + 1,))
+
+    def atrasadas(self):
+        hoje, _ = self.limites()
+        return self.intervalo((), (hoje,))
+
+    def a_terminar(self, dias): # prazo entre hoje e daqui a 'dias' dias
+        hoje, _ = self.limites()
+        return self.entre(hoje, hoje + dias)
+
+class IndiceEtiquetas:
+    # Índice invertido etiqueta -> tarefas (pelo id), mantido a cada alteração em vez de percorrer a lista
+    def __init__(self, tarefas=()):
+        self._por_etiqueta = {}  # etiqueta -> {id: tarefa}, pela ordem em que foram indexadas
+        self._etiquetas_de = {}  # id -> etiquetas indexadas (para saber o que retirar)
+        for tarefa in tarefas:
+            self.adicionar(tarefa)
+
+    def adicionar(self, tarefa):
+        etiquetas = tuple(dict.fromkeys(tarefa.etiquetas))
+        self._etiquetas_de[tarefa.id] = etiquetas
+        for etiqueta in etiquetas:
+            self._por_etiqueta.setdefault(etiqueta, {})[tarefa.id] = tarefa
+
+    def remover(self, tarefa):
+        for etiqueta in self._etiquetas_de.pop(tarefa.id, ()):
+            grupo = self._por_etiqueta[etiqueta]
+            del grupo[tarefa.id]
+            if not grupo:
+                del self._por_etiqueta[etiqueta]
+
+    def atualizar(self, tarefa): # só mexe no índice se as etiquetas mudaram
+        if self._etiquetas_de.get(tarefa.id) != tuple(dict.fromkeys(tarefa.etiquetas)):
+            self.remover(tarefa)
+            self.adicionar(tarefa)
+
+    def tarefas(self, etiqueta):
+        return list(self._por_etiqueta.get(etiqueta, {}).values())
+
+    def tamanho(self, etiqueta):
+        return len(self._por_etiqueta.get(etiqueta, ()))
+
+    def contagens(self): # etiqueta -> número de tarefas
+        return {etiqueta: len(grupo) for etiqueta, grupo in self._por_etiqueta.items()}
+
+    def com_alguma(self, etiquetas):
+        resultado = {}
+        for etiqueta in etiquetas:
+            resultado.update(self._por_etiqueta.get(etiqueta, {}))
+        return list(resultado.values())
+
+    def com_todas(self, etiquetas):
+        grupos = sorted((self._por_etiqueta.get(e, {}) for e in set(etiquetas)), key=len)
+        if not grupos:
+            return []
+        # percorre só o grupo mais pequeno e confirma nos outros
+        return [t for tarefa_id, t in grupos[0].items() if all(tarefa_id in g for g in grupos[1:])]
+
+class Consulta:
+    # Critérios combinados para GestorTarefas.consultar (None = sem restrição)
+    def __init__(self, prioridades=None, etiquetas=None, todas_etiquetas=True, prazo_de=None, prazo_ate=None,
+                 concluida=None, recorrencia=None, texto=None):
+        self.prioridades = {p.strip().capitalize() for p in prioridades} if prioridades else None
+        self.etiquetas = list(dict.fromkeys(etiquetas)) if etiquetas else None
+        self.todas_etiquetas = todas_etiquetas  # True: todas as etiquetas (E); False: alguma (OU)
+        self.prazo_de = prazo_de.toordinal() if prazo_de else None
+        self.prazo_ate = prazo_ate.toordinal() if prazo_ate else None
+        self.concluida = concluida
+        regra = RegraRecorrencia.de_texto(recorrencia)
+        self.recorrencia = regra.frequencia if regra else (recorrencia.lower() if recorrencia else None)
+        self.texto = normalizar_titulo(texto) if texto else None
+
+    def vazia(self):
+        return not (self.prioridades or self.etiquetas or self.prazo_de is not None or self.prazo_ate is not None
+                    or self.concluida is not None or self.recorrencia or self.texto)
+
+    def aceita(self, tarefa): # verificação completa de uma tarefa candidata
+        if self.prioridades and tarefa.prioridade not in self.prioridades:
+            return False
+        if self.etiquetas:
+            presentes = [e in tarefa.etiquetas for e in self.etiquetas]
+            if not (all(presentes) if self.todas_etiquetas else any(presentes)):
+                return False
+        if self.prazo_de is not None or self.prazo_ate is not None:
+            prazo = tarefa.prazo_ordinal
+            if prazo is None or (self.prazo_de is not None and prazo < self.prazo_de) \
+                    or (self.prazo_ate is not None and prazo > self.prazo_ate):
+                return False
+        if self.concluida is not None and tarefa.concluida != self.concluida:
+            return False
+        if self.recorrencia:
+            regra = tarefa.regra
+            if (regra.frequencia if regra else tarefa.recorrencia) != self.recorrencia:
+                return False
+        if self.texto and self.texto not in normalizar_titulo(tarefa.titulo):
+            return False
+        return True
+
+def _somar_meses(data, meses, dia): # o mesmo dia do mês (ou o último dia, se o mês for mais curto)
+    ano, mes = divmod(data.year * 12 + data.month - 1 + meses, 12)
+    seguinte = datetime(ano + mes // 11, (mes + 1) % 12 + 1, 1) # 1.º dia do mês seguinte
+    return data.replace(year=ano, month=mes + 1, day=min(dia, (seguinte - timedelta(days=1)).day))
+
+class RegraRecorrencia:
+    # Regra de repetição guardada como texto na própria tarefa, por exemplo 'mensal' ou
+    # 'semanal;intervalo=2;dias=seg,qua;fim=2025-12-31' (também dia=D e exceto=AAAA-MM-DD|...).
+    # As ocorrências são geradas quando são pedidas, a partir do prazo da tarefa modelo.
+    FREQUENCIAS = ('diaria', 'semanal', 'mensal', 'anual')
+
+    def __init__(self, frequencia, intervalo=1, dias=None, dia=None, fim=None, excecoes=None):
+        if frequencia not in self.FREQUENCIAS:
+            raise ValueError(f"Recorrência desconhecida: {frequencia}")
+        self.frequencia = frequencia
+        self.intervalo = max(1, int(intervalo))
+        self.dias = tuple(sorted(set(dias))) if dias and frequencia == 'semanal' else () # 0 = segunda-feira
+        self.dia = dia # dia do mês fixo (mensal/anual): depois de um mês curto volta ao dia certo
+        self.fim = fim # último dia possível (datetime) ou None
+        self.excecoes = frozenset(excecoes or ()) # ordinais das ocorrências que já são tarefas próprias
+
+    @classmethod
+    @functools.lru_cache(maxsize=LIMITE_CACHE_REGRAS) # cada exceção materializada cria um texto novo
+    def de_texto(cls, texto):
+        if not texto:
+            return None
+        try:
+            return cls._ler(texto)
+        except (ValueError, KeyError):
+            return None # texto livre antigo: a tarefa não se repete
+
+    @classmethod
+    def _ler(cls, texto):
+        partes = [p.strip() for p in normalizar_titulo(texto).split(";")]
+        opcoes = dict(p.split("=", 1) for p in partes[1:] if p)
+        return cls(
+            partes[0],
+            intervalo=int(opcoes.get("intervalo", 1)),
+            dias=[DIAS_SEMANA.index(d.strip()[:3]) for d in opcoes["dias"].split(",")] if "dias" in opcoes else None,
+            dia=int(opcoes["dia"]) if "dia" in opcoes else None,
+            fim=datetime.strptime(opcoes["fim"], "%Y-%m-%d") if "fim" in opcoes else None,
+            excecoes=[datetime.strptime(d, "%Y-%m-%d").toordinal() for d in opcoes["exceto"].split("|")]
+                     if "exceto" in opcoes else None)
+
+    def texto(self):
+        partes = [self.frequencia]
+        if self.intervalo != 1:
+            partes.append(f"intervalo={self.intervalo}")
+        if self.dias:
+            partes.append("dias=" + ",".join(DIAS_SEMANA[d] for d in self.dias))
+        if self.dia:
+            partes.append(f"dia={self.dia}")
+        if self.fim:
+            partes.append("fim=" + self.fim.strftime("%Y-%m-%d"))
+        if self.excecoes:
+            partes.append("exceto=" + "|".join(datetime.fromordinal(o).strftime("%Y-%m-%d") for o in sorted(self.excecoes)))
+        return ";".join(partes)
+
+    def copia(self, **alteracoes):
+        valores = dict(frequencia=self.frequencia, intervalo=self.intervalo, dias=self.dias, dia=self.dia,
+                       fim=self.fim, excecoes=self.excecoes)
+        valores.update(alteracoes)
+        return RegraRecorrencia(**valores)
+
+    def ocorrencias(self, inicio, desde=None): # datas a partir de 'inicio' (o prazo da modelo), sem fim se não houver 'fim'
+        desde = max(inicio, desde) if desde else inicio
+        if self.frequencia in ('mensal', 'anual'):
+            passo = self.intervalo * (12 if self.frequencia == 'anual' else 1)
+            meses = (desde.year - inicio.year) * 12 + desde.month - inicio.month
+            datas = (_somar_meses(inicio, k * passo, self.dia or inicio.day) for k in itertools.count(max(0, meses // passo - 1)))
+        elif self.dias: # semanal em dias fixos: semanas contadas a partir da semana de 'inicio'
+            semana = inicio - timedelta(days=inicio.weekday())
+            k0 = (desde - semana).days // (7 * self.intervalo)
+            datas = (semana + timedelta(days=7 * self.intervalo * k + d) for k in itertools.count(k0) for d in self.dias)
+        else:
+            passo = self.intervalo * (7 if self.frequencia == 'semanal' else 1)
+            datas = (inicio + timedelta(days=passo * k) for k in itertools.count((desde - inicio).days // passo))
+        for data in datas:
+            if self.fim and data > self.fim:
+                return
+            if data >= desde and data.toordinal() not in self.excecoes:
+                yield data
+
+    def proxima(self, depois_de): # primeira ocorrência estritamente depois da data dada (None se a regra acabou)
+        for data in self.ocorrencias(depois_de):
+            if data > depois_de:
+                return data
+        return None
+
+class Ocorrencia:
+    # Ocorrência futura de uma tarefa recorrente que ainda não existe como tarefa: só guarda a modelo e a data
+    __slots__ = ("modelo", "prazo")
+    concluida = False
+
+    def __init__(self, modelo, prazo):
+        self.modelo = modelo
+        self.prazo = prazo
+
+    titulo = property(lambda self: self.modelo.titulo)
+    prioridade = property(lambda self: self.modelo.prioridade)
+    etiquetas = property(lambda self: self.modelo.etiquetas)
+    recorrencia = property(lambda self: self.modelo.recorrencia)
+    prazo_ordinal = property(lambda self: self.prazo.toordinal())
+
+    def __str__(self):
+        return (f"[ ] {self.titulo} (Prioridade: {self.prioridade}, Prazo: {self.prazo.strftime('%Y-%m-%d')}, "
+                f"Etiquetas: {', '.join(self.etiquetas)}) [{self.modelo.regra.frequencia}]")
+
+    def linhas(self): # como Tarefa.linhas (uma ocorrência não tem subtarefas)
+        yield str(self)
+
+class IndiceRecorrencias:
+    # Tarefas principais com uma regra de recorrência válida e prazo (as modelos das ocorrências)
+    def __init__(self, tarefas=()):
+        self._tarefas = {}
+        for tarefa in tarefas:
+            self.adicionar(tarefa)
+
+    def adicionar(self, tarefa):
+        if tarefa.prazo_ordinal is not None and tarefa.regra is not None:
+            self._tarefas[tarefa.id] = tarefa
+
+    def remover(self, tarefa):
+        self._tarefas.pop(tarefa.id, None)
+
+    def atualizar(self, tarefa):
+        self.remover(tarefa)
+        self.adicionar(tarefa)
+
+    def tarefas(self):
+        return list(self._tarefas.values())
+
+class Temporizador:
+    # O fim é um instante de time.monotonic(): o tempo restante não depende de quantas vezes o ecrã é atualizado
+    __slots__ = ("chave", "titulo", "pomodoro", "fase", "duracao", "fim", "restante", "ciclos")
+
+    def __init__(self, chave, titulo, segundos, pomodoro, agora):
+        self.chave = chave # id da tarefa (ou outra chave única)
+        self.titulo = titulo
+        self.pomodoro = pomodoro
+        self.fase = "trabalho"
+        self.duracao = segundos # da fase atual
+        self.fim = agora + segundos # None enquanto está em pausa
+        self.restante = None # segundos que faltavam quando foi posto em pausa
+        self.ciclos = 0 # ciclos de trabalho completos (Pomodoro)
+
+    @property
+    def pausado(self):
+        return self.fim is None
+
+    def segundos_restantes(self, agora):
+        return self.restante if self.fim is None else max(0.0, self.fim - agora)
+
+    def texto(self, agora):
+        minutos, segundos = divmod(int(-(-self.segundos_restantes(agora) // 1)), 60) # arredonda para cima
+        texto = f"{self.titulo}: {minutos:02d}:{segundos:02d}"
+        if self.pomodoro:
+            texto += f" ({self.fase}, ciclo {self.ciclos + 1})" if self.fase == "trabalho" else f" ({self.fase})"
+        return texto + (" [em pausa]" if self.pausado else "")
+
+class FimDeFase:
+    # Fase que terminou num tique, com o estado do temporizador nesse momento: um tique atrasado pode
+    # atravessar várias fases e cada aviso tem de falar da sua
+    __slots__ = ("temporizador", "fase", "ciclos", "seguinte", "duracao")
+
+    def __init__(self, temporizador, fase, ciclos, seguinte=None, duracao=None):
+        self.temporizador = temporizador
+        self.fase = fase # a fase que terminou
+        self.ciclos = ciclos # ciclos de trabalho completos até aqui
+        self.seguinte = seguinte # fase que começou e a sua duração em segundos (None nos temporizadores simples)
+        self.duracao = duracao
+
+    def aviso(self): # mensagem para quando a fase termina
+        titulo = self.temporizador.titulo
+        if not self.temporizador.pomodoro:
+            return f"Temporizador concluído para '{titulo}'! Hora de fazer uma pausa."
+        if self.fase == "trabalho":
+            return f"'{titulo}': ciclo {self.ciclos} concluído. {self.seguinte.capitalize()} de {self.duracao // 60} minutos."
+        return f"'{titulo}': fim da {self.fase}. De volta ao trabalho!"
+
+class Temporizadores:
+    # Vários temporizadores ao mesmo tempo (um por tarefa), todos avançados pelo mesmo tique
+    def __init__(self, relogio=None, minutos=None, ciclos_pausa_longa=CICLOS_PAUSA_LONGA):
+        self.relogio = relogio or time.monotonic
+        self.minutos = dict(POMODORO_MINUTOS, **(minutos or {})) # duração de cada fase do Pomodoro
+        self.ciclos_pausa_longa = ciclos_pausa_longa
+        self._ativos = {} # chave -> Temporizador
+
+    def __len__(self):
+        return len(self._ativos)
+
+    def __iter__(self):
+        return iter(list(self._ativos.values()))
+
+    def __contains__(self, chave):
+        return chave in self._ativos
+
+    def obter(self, chave):
+        return self._ativos.get(chave)
+
+    def iniciar(self, chave, titulo, minutos=None, pomodoro=False):
+        if chave in self._ativos:
+            raise ValueError("Já existe um temporizador para esta tarefa.")
+        segundos = round((self.minutos["trabalho"] if minutos is None else minutos) * 60)
+        temporizador = Temporizador(chave, titulo, segundos, pomodoro, self.relogio())
+        self._ativos[chave] = temporizador
+        return temporizador
+
+    def pausar(self, chave):
+        temporizador = self._ativos[chave]
+        if not temporizador.pausado:
+            temporizador.restante = temporizador.segundos_restantes(self.relogio())
+            temporizador.fim = None
+
+    def retomar(self, chave):
+        temporizador = self._ativos[chave]
+        if temporizador.pausado:
+            temporizador.fim = self.relogio() + temporizador.restante
+            temporizador.restante = None
+
+    def parar(self, chave):
+        return self._ativos.pop(chave, None)
+
+    def tique(self): # [FimDeFase]; os simples saem, os Pomodoro passam à fase seguinte
+        agora = self.relogio()
+        eventos = []
+        for temporizador in list(self._ativos.values()):
+            while not temporizador.pausado and temporizador.fim <= agora:
+                fase = temporizador.fase
+                if not temporizador.pomodoro:
+                    eventos.append(FimDeFase(temporizador, fase, temporizador.ciclos))
+                    del self._ativos[temporizador.chave]
+                    break
+                self._avancar(temporizador)
+                eventos.append(FimDeFase(temporizador, fase, temporizador.ciclos, temporizador.fase, temporizador.duracao))
+        return eventos
+
+    def _avancar(self, temporizador):
+        if temporizador.fase == "trabalho":
+            temporizador.ciclos += 1
+            longa = temporizador.ciclos % self.ciclos_pausa_longa == 0
+            temporizador.fase = "pausa longa" if longa else "pausa"
+        else:
+            temporizador.fase = "trabalho"
+        temporizador.duracao = round(self.minutos[temporizador.fase] * 60)
+        temporizador.fim += temporizador.duracao # conta a partir do fim da fase anterior: os atrasos não se acumulam
+
+    def proximo_fim(self): # segundos até o próximo temporizador terminar uma fase (None se estão todos parados)
+        agora = self.relogio()
+        restantes = [t.segundos_restantes(agora) for t in self._ativos.values() if not t.pausado]
+        return min(restantes) if restantes else None
 
 class Tarefa:
-    def __init__(self, titulo, prioridade='Média', etiquetas=None, prazo=None, recorrencia=None, comentarios=None, subtarefas=None):
+    # Representação compacta: sem __dict__, prioridade/recorrência como códigos, etiquetas num tuplo de
+    # strings internadas e prazo como ordinal da data. Os atributos públicos continuam os mesmos.
+    # Cada nó da árvore de subtarefas conhece a tarefa mãe (_mae) e quantos descendentes estão pendentes
+    # (_pendentes, None enquanto não for preciso): concluir um nó atualiza só os seus antecessores.
+    # Cerca de 268 bytes por tarefa em vez de 630 (tracemalloc, 100 000 tarefas com from_dict); _mae,
+    # _pendentes e origem juntam mais 24.
+    __slots__ = ("id", "titulo", "_prioridade", "_etiquetas", "_prazo", "_recorrencia",
+                 "_comentarios", "_comentarios_dados", "_subtarefas", "_subtarefas_dados", "_concluida",
+                 "_pendentes", "_mae", "origem")
+    _proximo_id = 1
+
+    def __init__(self, titulo, prioridade='Média', etiquetas=None, prazo=None, recorrencia=None, comentarios=None, subtarefas=None, id=None,
+                 origem=None):
+        if id is None: # identificador persistente (gravado no JSON)
+            id = Tarefa._proximo_id
+        Tarefa._proximo_id = max(Tarefa._proximo_id, id + 1)
+        self.id = id
+        self._mae = None
+        self._concluida = False
         self.titulo = titulo.strip() if titulo else "Tarefa sem título"
         self.prioridade = prioridade.capitalize() if prioridade else 'Média' # 'Alta', 'Média', 'Baixa'
-        self.etiquetas = etiquetas if etiquetas else []
+        self.etiquetas = etiquetas
         self.prazo = prazo  # tipo datetime
         self.recorrencia = recorrencia.lower() if recorrencia else None  # 'diaria', 'semanal', None
-        self.comentarios = comentarios if comentarios else []
-        self.subtarefas = subtarefas if subtarefas else []
-        self.concluida = False
+        self.comentarios = comentarios
+        self.subtarefas = subtarefas
+        self.origem = origem # id da tarefa recorrente de que esta é uma ocorrência (None nas tarefas normais)
+
+    @property
+    def prioridade(self):
+        codigo = self._prioridade
+        return PRIORIDADES[codigo] if type(codigo) is int else codigo
+
+    @prioridade.setter
+    def prioridade(self, valor):
+        self._prioridade = _CODIGO_PRIORIDADE.get(valor, valor)
+
+    @property
+    def recorrencia(self):
+        codigo = self._recorrencia
+        return RECORRENCIAS[codigo] if type(codigo) is int else codigo
+
+    @recorrencia.setter
+    def recorrencia(self, valor):
+        regra = RegraRecorrencia.de_texto(valor)
+        if regra is not None: # forma canónica ('Diária' -> 'diaria')
+            valor = regra.texto()
+        self._recorrencia = _CODIGO_RECORRENCIA.get(valor, valor)
+
+    @property
+    def regra(self): # RegraRecorrencia ou None
+        return RegraRecorrencia.de_texto(self.recorrencia)
+
+    @property
+    def etiquetas(self):
+        return self._etiquetas
+
+    @etiquetas.setter
+    def etiquetas(self, valor):
+        self._etiquetas = tuple(sys.intern(e) for e in valor) if valor else ()
+
+    @property
+    def prazo(self): # só a data interessa: guarda-se o ordinal
+        return datetime.fromordinal(self._prazo) if self._prazo is not None else None
+
+    @prazo.setter
+    def prazo(self, valor):
+        self._prazo = valor.toordinal() if valor else None
+
+    @property
+    def prazo_ordinal(self):
+        return self._prazo
+
+    # Subtarefas e comentários podem ficar por descodificar (from_dict(..., preguicoso=True)):
+    # guardam-se os dados lidos e só se constroem na primeira vez que são acedidos.
+    @property
+    def subtarefas(self):
+        if self._subtarefas is None: # os ids de toda a árvore já foram reservados por from_dict
+            with _TRAVA_PREGUICOSA:
+                if self._subtarefas is None:
+                    subtarefas = [Tarefa._de_dados(sub, preguicoso=True) for sub in self._subtarefas_dados]
+                    for sub in subtarefas:
+                        sub._mae = self
+                    self._subtarefas = subtarefas # só fica visível depois de completa
+                    self._subtarefas_dados = None
+        return self._subtarefas
+
+    @subtarefas.setter
+    def subtarefas(self, valor):
+        if valor: # listas vazias só são criadas quando usadas
+            self._subtarefas, self._subtarefas_dados = valor, None
+            for sub in valor:
+                sub._mae = self
+        else:
+            self._subtarefas_dados, self._subtarefas = (), None
+        self._pendentes = None
+
+    def _subtarefas_lidas(self): # subtarefas ou os dados por hidratar, sem hidratar
+        dados = self._subtarefas_dados # lido antes da lista: só passa a None depois de a lista estar criada
+        return self._subtarefas if dados is None else dados
+
+    @property
+    def concluida(self):
+        return self._concluida
+
+    @concluida.setter
+    def concluida(self, valor):
+        valor = bool(valor)
+        if valor == self._concluida:
+            return
+        if self._mae is None: # tarefa principal: nada a propagar
+            self._concluida = valor
+            return
+        self._contar_antecessores()
+        self._concluida = valor
+        self._propagar(-1 if valor else 1)
+
+    def adicionar_subtarefa(self, subtarefa):
+        self._contar_antecessores()
+        if self._pendentes is None:
+            self._pendentes = self._contar_pendentes()
+        self.subtarefas.append(subtarefa)
+        subtarefa._mae = self
+        delta = (not subtarefa._concluida) + subtarefa.subtarefas_pendentes
+        pendente = not self._concluida
+        self._pendentes += delta
+        self._concluida = self._pendentes == 0 # a tarefa só está concluída se não restar nada pendente
+        self._propagar(delta + (not self._concluida) - pendente)
+
+    @property
+    def subtarefas_pendentes(self): # descendentes (a qualquer nível) por concluir
+        if self._pendentes is None:
+            self._pendentes = self._contar_pendentes()
+        return self._pendentes
+
+    def _contar_pendentes(self): # percorre a subárvore sem recursão; usa as contagens já conhecidas
+        total, pendentes = 0, [self]
+        while pendentes:
+            no = pendentes.pop()
+            if isinstance(no, dict):
+                filhos = no.get("subtarefas") or ()
+            else:
+                filhos = no._subtarefas_lidas()
+            for sub in filhos:
+                if isinstance(sub, dict):
+                    total += not sub.get("concluida", False)
+                    pendentes.append(sub)
+                else:
+                    total += not sub._concluida
+                    if sub._pendentes is not None:
+                        total += sub._pendentes
+                    else:
+                        pendentes.append(sub)
+        return total
+
+    def _contar_antecessores(self): # antes de uma alteração: todos os antecessores ficam com a contagem conhecida
+        mae = self._mae
+        while mae is not None:
+            if mae._pendentes is None:
+                mae._pendentes = mae._contar_pendentes()
+            mae = mae._mae
+
+    def _propagar(self, delta): # delta: variação dos pendentes na subárvore de self; O(profundidade)
+        mae = self._mae
+        while mae is not None and delta:
+            mae._pendentes += delta
+            concluida = mae._pendentes == 0
+            if concluida != mae._concluida: # a conclusão sobe até onde mudar alguma coisa
+                mae._concluida = concluida
+                delta += -1 if concluida else 1
+            mae = mae._mae
+
+    @property
+    def comentarios(self):
+        if self._comentarios is None:
+            with _TRAVA_PREGUICOSA:
+                if self._comentarios is None:
+                    self._comentarios = list(self._comentarios_dados)
+                    self._comentarios_dados = None
+        return self._comentarios
+
+    @comentarios.setter
+    def comentarios(self, valor):
+        if valor:
+            self._comentarios, self._comentarios_dados = valor, None
+        else:
+            self._comentarios_dados, self._comentarios = (), None
+
+    def _comentarios_lidos(self): # como _subtarefas_lidas
+        dados = self._comentarios_dados
+        return self._comentarios if dados is None else dados
+
+    def textos(self): # (texto, campo) do título, comentários e subtarefas, sem hidratar o que ainda não foi usado
+        yield self.titulo, "titulo"
+        for comentario in self._comentarios_lidos():
+            yield comentario, "comentario"
+        pendentes = [self._subtarefas_lidas()]
+        while pendentes:
+            for sub in pendentes.pop():
+                if isinstance(sub, dict):
+                    yield sub.get("titulo") or "", "subtarefa"
+                    pendentes.append(sub.get("subtarefas") or ())
+                else:
+                    yield sub.titulo, "subtarefa"
+                    pendentes.append(sub._subtarefas_lidas())
+
+    @property
+    def num_subtarefas(self): # contagens sem hidratar
+        return len(self._subtarefas_lidas())
+
+    @property
+    def num_comentarios(self):
+        return len(self._comentarios_lidos())
+
+    def arvore(self): # (nivel, tarefa) de toda a árvore, em pré-ordem e sem recursão
+        pendentes = [(0, self)]
+        while pendentes:
+            nivel, tarefa = pendentes.pop()
+            yield nivel, tarefa
+            if tarefa.num_subtarefas:
+                pendentes.extend((nivel + 1, sub) for sub in reversed(tarefa.subtarefas))
 
     def __str__(self, nivel=0):
-        indent = "  " * nivel
-        status = "✓" if self.concluida else " "
-        prazo_str = self.prazo.strftime("%Y-%m-%d") if self.prazo else "Sem data de conclusão prevista."
-        # Gerar string das subtarefas, se existirem
-        subtarefas_str = "\n".join([sub.__str__(nivel + 1) for sub in self.subtarefas])
-        base_str = f"{indent}[{status}] {self.titulo} (Prioridade: {self.prioridade}, Prazo: {prazo_str}, Etiquetas: {', '.join(self.etiquetas)})"
-        return f"{base_str}\n{subtarefas_str}" if subtarefas_str else base_str
+        return "\n".join(self.linhas(nivel))
+
+    def linhas(self, nivel=0): # uma linha por tarefa da árvore, geradas à medida que são escritas
+        for n, tarefa in self.arvore():
+            indent = "  " * (nivel + n)
+            status = "✓" if tarefa.concluida else " "
+            prazo_str = tarefa.prazo.strftime("%Y-%m-%d") if tarefa.prazo else "Sem data de conclusão prevista."
+            yield f"{indent}[{status}] {tarefa.titulo} (Prioridade: {tarefa.prioridade}, Prazo: {prazo_str}, Etiquetas: {', '.join(tarefa.etiquetas)})"
 
     def verificar_conclusao(self):
         # A tarefa só é concluída se todas as subtarefas estiverem concluídas (se houver subtarefas)
-        if self.subtarefas:
-            self.concluida = all(sub.concluida for sub in self.subtarefas)
+        if self.num_subtarefas:
+            self.concluida = self.subtarefas_pendentes == 0
         return self.concluida
     
     def to_dict(self): #Converter tarefa em dict para JSON
-        return {
+        raiz = self._dict_proprio()
+        pendentes = [raiz] # árvore convertida sem recursão
+        while pendentes:
+            subtarefas = pendentes.pop()["subtarefas"]
+            for i, sub in enumerate(subtarefas):
+                if isinstance(sub, Tarefa):
+                    dados_sub = subtarefas[i] = sub._dict_proprio()
+                    pendentes.append(dados_sub)
+        return raiz
+
+    def _dict_proprio(self): # o dict desta tarefa, com as subtarefas hidratadas (objetos Tarefa) ainda por converter
+        dados = {
+            "id": self.id,
             "titulo": self.titulo,
             "prioridade": self.prioridade,
-            "etiquetas": self.etiquetas,
+            "etiquetas": list(self._etiquetas),
             "prazo": self.prazo.strftime("%Y-%m-%d") if self.prazo else None,
             "recorrencia": self.recorrencia,
-            "comentarios": self.comentarios,
-            "subtarefas": [sub.to_dict() for sub in self.subtarefas],
-            "concluida": self.concluida
+            "comentarios": list(self._comentarios_lidos()),
+            "subtarefas": list(self._subtarefas_lidas()), # por hidratar: os dados lidos já estão no formato certo
+            "concluida": self._concluida
         }
+        if self.origem is not None: # só as ocorrências de recorrentes levam a origem
+            dados["origem"] = self.origem
+        return dados
+
+    @staticmethod
+    def _atribuir_ids(dados): # subtarefas por hidratar: reserva os ids que já têm e numera as que não têm (dados antigos)
+        pendentes = list(dados.get("subtarefas") or [])
+        while pendentes:
+            sub = pendentes.pop()
+            if sub.get("id") is None:
+                sub["id"] = Tarefa._proximo_id
+            Tarefa._proximo_id = max(Tarefa._proximo_id, sub["id"] + 1)
+            pendentes.extend(sub.get("subtarefas") or [])
 
     @staticmethod
-    def from_dict(data):
+    def from_dict(data, preguicoso=False):
+        if preguicoso:
+            Tarefa._atribuir_ids(data)
+            return Tarefa._de_dados(data, preguicoso=True)
+        raiz = Tarefa._de_dados(data)
+        pendentes = [(raiz, data)] # árvore construída sem recursão
+        while pendentes:
+            mae, dados = pendentes.pop()
+            if dados.get("subtarefas"):
+                mae.subtarefas = [Tarefa._de_dados(sub) for sub in dados["subtarefas"]]
+                pendentes.extend(zip(mae.subtarefas, dados["subtarefas"]))
+        return raiz
+
+    @staticmethod
+    def _de_dados(data, preguicoso=False): # uma tarefa sem as subtarefas (ou com os dados delas por hidratar)
         prazo = datetime.strptime(data["prazo"], "%Y-%m-%d") if data.get("prazo") else None
-        subtarefas = [Tarefa.from_dict(sub) for sub in data.get("subtarefas", [])]
         tarefa = Tarefa(
             titulo=data.get("titulo"),
             prioridade=data.get("prioridade"),
             etiquetas=data.get("etiquetas"),
             prazo=prazo,
             recorrencia=data.get("recorrencia"),
-            comentarios=data.get("comentarios"),
-            subtarefas=subtarefas
+            comentarios=None if preguicoso else data.get("comentarios"),
+            id=data.get("id"),
+            origem=data.get("origem")
         )
-        tarefa.concluida = data.get("concluida", False)
+        if preguicoso:
+            tarefa._subtarefas, tarefa._subtarefas_dados = None, data.get("subtarefas") or ()
+            tarefa._comentarios, tarefa._comentarios_dados = None, data.get("comentarios") or ()
+        tarefa._concluida = bool(data.get("concluida", False))
         return tarefa
 
 class GestorTarefas:
-    def __init__(self, arquivo_json="tarefas.json"):
-        
+    def __init__(self, arquivo_json="tarefas.json", usar_journal=True, limite_journal=LIMITE_JOURNAL, armazenamento=None,
+                 carregamento_preguicoso=True, autosave=True, atraso_autosave=ATRASO_AUTOSAVE, limite_historico=LIMITE_HISTORICO,
+                 tamanho_pagina=TAMANHO_PAGINA):
         self.tarefas = []
-        self.historico = [] # armaneza ações para o desfazer
+        self.limite_historico = limite_historico
+        self.tamanho_pagina = tamanho_pagina
+        # armaneza ações para o desfazer: (acao, tarefa, valores anteriores), só as últimas 'limite_historico'
+        self.historico = deque(maxlen=limite_historico)
         self.arquivo_json = arquivo_json
+        self.carregamento_preguicoso = carregamento_preguicoso # subtarefas/comentários só descodificados quando usados
+        self._indice_etiquetas = None # criado na primeira pesquisa por etiqueta e depois mantido a cada alteração
+        self._indice_titulos = None # idem, na primeira verificação de duplicados
+        self._ordem_prioridade = None # idem, na primeira listagem
+        self._indice_prazos = None # idem, na primeira consulta de prazos
+        self._prazos_hoje = IndicePrazos() # só para os avisos de prazo, sem criar o índice
+        self._indice_texto = None # idem, na primeira pesquisa de texto
+        self._indice_recorrencias = None # idem, na primeira consulta da agenda
+        self._ultima_listagem = [] # tarefas pela ordem em que foram mostradas (para os números escolhidos na consola)
+        self._ultima_agenda = [] # idem, para a agenda (tarefas e ocorrências)
+        self.ultimo_plano = None # (índice usado, candidatos estimados) da última consulta combinada
+        self._titulos_subtarefas = {} # id da tarefa principal -> IndiceTitulos das subtarefas
+        self._posicoes = None # id -> posição em self.tarefas (recalculado quando uma inserção/remoção desloca a lista)
+        self._subtarefas_por_id = self._pai_de = None # id -> subtarefa / id -> tarefa mãe, criados na primeira procura
+        # Motor de armazenamento: JSON + journal por omissão, ou ArmazenamentoSQLite
+        self.armazenamento = armazenamento or ArmazenamentoJSON(arquivo_json, usar_journal, limite_journal)
+        # Gravação em segundo plano; autosave=False grava de forma síncrona em cada alteração
+        self.gravador = GravadorAutomatico(self.armazenamento, self._dados_completos, atraso_autosave) if autosave else None
         self.carregar_dados()
 
-    def adicionar_tarefa(self, tarefa):
-        for t in self.tarefas: #Verifica duplicados (título igual)
-            if t.titulo.lower() == tarefa.titulo.lower():
-                resposta = input(f"Tarefa Duplicada. Já existe uma tarefa chamada '{tarefa.titulo}'.\n Se deseja continuar prima '1'?")
+    def adicionar_tarefa(self, tarefa, verificar_duplicados=True):
+        if verificar_duplicados: #Verifica duplicados (título igual, sem contar maiúsculas nem acentos)
+            existentes = self.indice_titulos.procurar(tarefa.titulo)
+            if existentes:
+                resposta = input(f"Tarefa Duplicada. Já existe uma tarefa chamada '{existentes[0].titulo}'.\n Se deseja continuar prima '1'?")
                 if resposta != '1':
                     print("Operação cancelada pelo utilizador.")
                     return  # não adiciona
-        self.tarefas.append(tarefa)
-        self.historico.append(('adicionar', tarefa))
+        operacao = self._inserir_tarefa(tarefa)
         print("Tarefa adicionada com sucesso!")
-        self.salvar_dados()  # salva imediatamente
+        self._registar(operacao, self._acao_historico('adicionar', tarefa))
 
-    def listar_tarefas(self, filtro_etiqueta=None, mostrar_comentarios=False):
-        tarefas_filtradas = self.tarefas
-        if filtro_etiqueta:
-            tarefas_filtradas = [t for t in self.tarefas if filtro_etiqueta in t.etiquetas]
-        # Ordenar por prioridade: Alta > Média > Baixa
-        prioridade_ordem = {'Alta': 1, 'Média': 2, 'Baixa': 3}
-        tarefas_filtradas.sort(key=lambda x: prioridade_ordem.get(x.prioridade, 4))
+    def _inserir_tarefa(self, tarefa): # acrescenta no fim e devolve a operação para o journal (sem histórico)
+        self.tarefas.append(tarefa)
+        if self._posicoes is not None:
+            self._posicoes[tarefa.id] = len(self.tarefas) - 1
+        self._indexar(tarefa)
+        return {"op": "inserir", "indice": len(self.tarefas) - 1, "tarefa": tarefa.to_dict()}
+
+    def listar_tarefas(self, filtro_etiqueta=None, mostrar_comentarios=False, limite=None, consulta=None):
+        # Ordenado por prioridade (Alta > Média > Baixa), depois prazo; a lista guardada não é reordenada
+        tarefas_filtradas = self._filtrar(filtro_etiqueta, consulta, limite)
+        self._ultima_listagem = tarefas_filtradas
         if not tarefas_filtradas: 
             print("Nenhuma tarefa encontrada.")
-            return
-        
-        for i, t in enumerate(tarefas_filtradas):
-            aviso = "" #Avisos de prazo
-            if t.prazo:
-                dias_restantes = (t.prazo - datetime.now()).days
-                if dias_restantes < 0:
-                    aviso = " [ATRASADA!]"
-                elif dias_restantes <= 3:
-                    aviso = " [Prazo Próximo]"
-            print(f"{i+1}. {t}{aviso}")
-
-            if mostrar_comentarios and t.comentarios:
-                print("   Comentários:")
+            return tarefas_filtradas
+        _escrever(self._linhas_listagem(tarefas_filtradas, mostrar_comentarios))
+        return tarefas_filtradas
+
+    def _filtrar(self, filtro_etiqueta=None, consulta=None, limite=None):
+        if consulta is not None: # filtros combinados
+            return self.consultar(consulta)[:limite]
+        if hasattr(self.armazenamento, "filtrar_posicoes"): # filtro e ordem feitos pelo motor (SQL com índices)
+            return [self.tarefas[i] for i in self._posicoes_motor(etiqueta=filtro_etiqueta)[:limite]]
+        if filtro_etiqueta:
+            return self.ordem_prioridade.ordenar(self.tarefas_com_etiqueta(filtro_etiqueta))[:limite]
+        return self.ordem_prioridade.primeiras(limite)
+
+    def _posicoes_motor(self, **filtros): # só são lidas as tarefas que o motor devolver
+        self.flush()  # as posições na base de dados têm de corresponder à lista em memória
+        return self.armazenamento.filtrar_posicoes(**filtros)
+
+    def _linhas_listagem(self, tarefas, mostrar_comentarios=False):
+        for i, t in enumerate(tarefas):
+            linhas = t.linhas()
+            yield f"{i+1}. {next(linhas)}{self.aviso_prazo(t)}" #Avisos de prazo
+            yield from linhas
+            if mostrar_comentarios and t.num_comentarios:
+                yield "   Comentários:"
                 for j, comentario in enumerate(t.comentarios):
-                    print(f"     {j+1}. {comentario}")
+                    yield f"     {j+1}. {comentario}"
+
+    # Listagem por páginas: só as tarefas da página são formatadas e os números referem-se à página mostrada
+    def paginar(self, filtro_etiqueta=None, consulta=None, tamanho=None):
+        tamanho = tamanho or self.tamanho_pagina
+        if consulta is None and hasattr(self.armazenamento, "filtrar_posicoes"): # só as tarefas da página são lidas
+            ids = list(self.tarefas.ids()) if hasattr(self.tarefas, "ids") else [t.id for t in self.tarefas]
+            return Paginador(ListagemPorIds([ids[i] for i in self._posicoes_motor(etiqueta=filtro_etiqueta)], self.obter),
+                             tamanho)
+        if consulta is None and not filtro_etiqueta: # a vista ordenada é percorrida sem a copiar
+            return Paginador(self.ordem_prioridade, tamanho)
+        return Paginador(self._filtrar(filtro_etiqueta, consulta), tamanho)
+
+    def mostrar_pagina(self, paginador, mostrar_comentarios=False):
+        tarefas = paginador.pagina()
+        self._ultima_listagem = tarefas
+        if not tarefas:
+            print("Nenhuma tarefa encontrada.")
+            return tarefas
+        cabecalho = f"--- Página {paginador.numero}/{paginador.total_paginas} ({paginador.total} tarefas) ---"
+        _escrever(itertools.chain((cabecalho,), self._linhas_listagem(tarefas, mostrar_comentarios)))
+        return tarefas
 
-    def concluir_tarefa(self, indice):
+    def concluir_tarefa(self, tarefa_id):
+        indice = self._posicao_id(tarefa_id)
         try:
+            if indice is None:
+                raise KeyError(tarefa_id)
             tarefa = self.tarefas[indice]
             # Se tiver subtarefas, verificar se todas estão concluídas
-            if tarefa.subtarefas:
+            if tarefa.num_subtarefas:
                 if not tarefa.verificar_conclusao():
                     print("Não é possível concluir esta tarefa principal pois há subtarefas pendentes.")
                     return
 
-            tarefa.concluida = True
-            self.historico.append(('concluir', tarefa))
-            # Se for recorrente, criar nova tarefa para próxima data
-            if tarefa.recorrencia:
-                nova_data = None
-                if tarefa.recorrencia == 'diaria':
-                    nova_data = tarefa.prazo + timedelta(days=1) if tarefa.prazo else None
-                elif tarefa.recorrencia == 'semanal':
-                    nova_data = tarefa.prazo + timedelta(weeks=1) if tarefa.prazo else None
-                if nova_data:
-                    nova_tarefa = Tarefa(titulo=tarefa.titulo, prioridade=tarefa.prioridade,
-                                         etiquetas=list(tarefa.etiquetas), prazo=nova_data,
-                                         recorrencia=tarefa.recorrencia, comentarios=list(tarefa.comentarios),
-                                         subtarefas=[])
-                    self.adicionar_tarefa(nova_tarefa)
+            regra = tarefa.regra
+            proxima = regra.proxima(tarefa.prazo) if regra and tarefa.prazo else None
+            if proxima:
+                self._avancar_recorrente(indice, tarefa, regra, proxima)
+            else:
+                antes = {"concluida": tarefa.concluida}
+                tarefa.concluida = True
+                self._registar({"op": "atualizar", "indice": indice, "tarefa": tarefa.to_dict()},
+                               self._acao_historico('concluir', tarefa, antes))
             print("Tarefa marcada como concluída!")
-            self.salvar_dados()  # salva imediatamente
-        except IndexError:
-            print("Índice inválido.")
+        except KeyError:
+            print("Tarefa inválida.")
 
-    def remover_tarefa(self, indice):
-        try:
-            tarefa = self.tarefas.pop(indice)
-            self.historico.append(('remover', tarefa))
-            print(f"Tarefa '{tarefa.titulo}' removida.")
-            self.salvar_dados()  # salva imediatamente
-        except IndexError:
-            print("Índice inválido.")
+    def _avancar_recorrente(self, indice, tarefa, regra, proxima):
+        # A tarefa recorrente é a modelo de todas as ocorrências: a ocorrência concluída fica registada como
+        # tarefa simples e a modelo passa para a próxima data (não se copiam etiquetas nem comentários)
+        antes = {"concluida": False, "prazo": tarefa.prazo_ordinal, "recorrencia": tarefa.recorrencia}
+        if regra.frequencia in ('mensal', 'anual') and not regra.dia and tarefa.prazo.day > 28:
+            regra = regra.copia(dia=tarefa.prazo.day) # ex.: 31 de janeiro -> 28 de fevereiro -> 31 de março
+        if regra.excecoes: # as exceções já passadas deixam de ser precisas
+            regra = regra.copia(excecoes={o for o in regra.excecoes if o > proxima.toordinal()})
+        registo = Tarefa(titulo=tarefa.titulo, prioridade=tarefa.prioridade, etiquetas=tarefa.etiquetas,
+                         prazo=tarefa.prazo, origem=tarefa.id)
+        registo.concluida = True
+        antes["registo"] = registo.id # desfazer retira também o registo da ocorrência
+        tarefa.prazo = proxima
+        tarefa.recorrencia = regra.texto()
+        for _, sub in itertools.islice(tarefa.arvore(), 1, None): # as subtarefas voltam a estar por fazer
+            sub._concluida, sub._pendentes = False, None
+        tarefa._pendentes = None
+        tarefa.concluida = False # verificar_conclusao pode tê-la marcado
+        for indice_tarefas in self._indices():
+            indice_tarefas.atualizar(tarefa)
+        self._registar({"op": "atualizar", "indice": indice, "tarefa": tarefa.to_dict()},
+                       self._inserir_tarefa(registo), self._acao_historico('concluir', tarefa, antes))
+        print(f"Próxima ocorrência de '{tarefa.titulo}': {proxima.strftime('%Y-%m-%d')}.")
+
+    def remover_tarefa(self, tarefa_id):
+        indice = self._posicao_id(tarefa_id)
+        if indice is None:
+            print("Tarefa inválida.")
+            return
+        tarefa = self.tarefas.pop(indice)
+        self._posicoes = None # as seguintes mudaram de posição
+        self._desindexar(tarefa)
+        print(f"Tarefa '{tarefa.titulo}' removida.")
+        # para o desfazer: volta para depois da tarefa que a antecedia (a posição fica como alternativa)
+        antes = {"indice": indice, "depois_de": self.tarefas[indice - 1].id if indice > 0 else None}
+        self._registar({"op": "remover", "indice": indice, "id": tarefa.id},
+                       self._acao_historico('remover', tarefa, antes))
 
     def desfazer_ultima_acao(self):
         if not self.historico:
             print("Nada para desfazer.")
-            return
-        acao, tarefa = self.historico.pop()
+            return None
+        acao, tarefa, antes = self.historico.pop()
+        operacoes = [{"op": "desfazer"}]
         if acao == 'adicionar':
-            self.tarefas.remove(tarefa)
-            print("Ação desfeita: tarefa adicionada removida.")
-        elif acao[0] == 'remover':
-            _, tarefa, indice = acao
+            indice = self._posicao(tarefa)
+            if indice is not None:
+                self.tarefas.pop(indice)
+                self._posicoes = None
+                self._desindexar(tarefa)
+                operacoes.append({"op": "remover", "indice": indice})
+            modelo = self.obter(antes["modelo"]) if "modelo" in antes else None
+            if modelo is not None: # ocorrência materializada: a regra perde a exceção
+                modelo.recorrencia = antes["recorrencia"]
+                raiz = self.tarefa_principal_de(modelo)
+                for indice_tarefas in self._indices():
+                    indice_tarefas.atualizar(raiz)
+                operacoes.append({"op": "atualizar", "indice": self._posicao(raiz), "tarefa": raiz.to_dict()})
+            print(f"Ação desfeita: tarefa '{tarefa.titulo}' removida.")
+        elif acao == 'remover':
+            indice = min(antes["indice"], len(self.tarefas))
+            if "depois_de" in antes:
+                anterior = self._posicao_id(antes["depois_de"]) if antes["depois_de"] is not None else -1
+                if anterior is not None:
+                    indice = anterior + 1
             self.tarefas.insert(indice, tarefa)
+            self._posicoes = None
+            self._indexar(tarefa)
+            operacoes.append({"op": "inserir", "indice": indice, "tarefa": tarefa.to_dict()})
             print(f"Ação desfeita: tarefa '{tarefa.titulo}' restaurada na posição original.")
         elif acao == 'concluir':
-            tarefa.concluida = False
+            registo = self._posicao_id(antes["registo"]) if "registo" in antes else None
+            if registo is not None: # ocorrência de uma tarefa recorrente: o registo criado sai com ela
+                self._desindexar(self.tarefas.pop(registo))
+                self._posicoes = None
+                operacoes.append({"op": "remover", "indice": registo})
+            tarefa.concluida = antes["concluida"] # o próprio objeto da lista, não uma cópia
+            if "prazo" in antes: # tarefa recorrente: volta à ocorrência anterior
+                tarefa.prazo = datetime.fromordinal(antes["prazo"])
+                tarefa.recorrencia = antes["recorrencia"]
+                for indice_tarefas in self._indices():
+                    indice_tarefas.atualizar(tarefa)
+            indice = self._posicao(tarefa)
+            if indice is not None:
+                operacoes.append({"op": "atualizar", "indice": indice, "tarefa": tarefa.to_dict()})
             print(f"Ação desfeita: tarefa '{tarefa.titulo}' marcada como não concluída.")
-        self.salvar_dados()  # salva imediatamente
+        self._registar(*operacoes)
+        return (acao, tarefa)
 
-    def iniciar_temporizador(self, minutos=25):
+    def iniciar_temporizador(self, minutos=25, ciclos=0):
+        # ciclos > 0: Pomodoro com esse número de ciclos de trabalho (pausas entre eles e uma longa a cada CICLOS_PAUSA_LONGA)
+        temporizadores = Temporizadores(minutos={"trabalho": minutos})
+        temporizador = temporizadores.iniciar("consola", "Foco", pomodoro=ciclos > 0)
         print(f"A iniciar Temporizador de {minutos} minutos. Foca na tarefa!")
+        minuto_mostrado = 0
         try:
-            for i in range(minutos * 60):
-                time.sleep(1)
-                if i % 60 == 0:
-                    print(f"Tempo passado: {i//60} minutos")
-            print("Temporizador terminado! Hora de fazer uma pausa.")
+            while temporizadores:
+                for evento in temporizadores.tique():
+                    minuto_mostrado = 0
+                    if not temporizador.pomodoro:
+                        print("Temporizador terminado! Hora de fazer uma pausa.")
+                    elif evento.fase == "trabalho" and evento.ciclos >= ciclos:
+                        temporizadores.parar(temporizador.chave)
+                        print(f"Pomodoro terminado: {ciclos} ciclos concluídos.")
+                        break # as fases seguintes já não contam
+                    else:
+                        print(evento.aviso())
+                if not temporizadores:
+                    break
+                restante = temporizador.segundos_restantes(temporizadores.relogio())
+                decorrido = temporizador.duracao - restante
+                if int(decorrido // 60) > minuto_mostrado:
+                    minuto_mostrado = int(decorrido // 60)
+                    print(f"Tempo passado: {minuto_mostrado} minutos")
+                time.sleep(min(restante, 60 - decorrido % 60)) # acorda no próximo minuto ou no fim da fase
         except KeyboardInterrupt:
             print("\nTemporizador interrompido.")
 
 # metodos para subtarefas
-    def adicionar_subtarefa(self, indice_tarefa_principal, titulo_subtarefa):
+    def adicionar_subtarefa(self, id_tarefa_principal, titulo_subtarefa):
         try:
-            tarefa_principal = self.tarefas[indice_tarefa_principal]
-            for sub in tarefa_principal.subtarefas:
-                if sub.titulo.lower() == titulo_subtarefa.lower():
-                    resposta = input(f"Já existe uma subtarefa chamada '{titulo_subtarefa}' nesta tarefa. Se deseja continuar prima 1: ").strip().lower()
-                    if resposta != '1':
-                        print("Operação cancelada pelo utilizador.")
-                        return  # não adiciona
+            tarefa_principal = self._obter(id_tarefa_principal)
+            titulos = self._indice_subtarefas(tarefa_principal)
+            if titulos.procurar(titulo_subtarefa):
+                resposta = input(f"Já existe uma subtarefa chamada '{titulo_subtarefa}' nesta tarefa. Se deseja continuar prima 1: ").strip().lower()
+                if resposta != '1':
+                    print("Operação cancelada pelo utilizador.")
+                    return  # não adiciona
             subtarefa = Tarefa(titulo_subtarefa)
-            tarefa_principal.subtarefas.append(subtarefa)
+            tarefa_principal.adicionar_subtarefa(subtarefa) # a tarefa mãe (e as de cima) deixam de estar concluídas
+            titulos.adicionar(subtarefa)
+            if self._subtarefas_por_id is not None:
+                self._subtarefas_por_id[subtarefa.id] = subtarefa
+                self._pai_de[subtarefa.id] = tarefa_principal
+            raiz = self.tarefa_principal_de(tarefa_principal)
+            self._atualizar_texto(raiz)
             print(f"Subtarefa '{titulo_subtarefa}' adicionada à tarefa '{tarefa_principal.titulo}'.")
-            self.salvar_dados()  # salva imediatamente
-        except IndexError:
-            print("Índice da tarefa principal inválido.")
+            self._registar_tarefa(raiz)
+        except KeyError:
+            print("Tarefa principal inválida.")
 
-    def listar_subtarefas(self, indice_tarefa_principal):
-        try:
-            tarefa_principal = self.tarefas[indice_tarefa_principal]
-            if not tarefa_principal.subtarefas:
-                print("Esta tarefa principal não tem subtarefas.")
-                return
-            print(f"Subtarefas da tarefa '{tarefa_principal.titulo}':")
-            for i, sub in enumerate(tarefa_principal.subtarefas):
-                status = "✓" if sub.concluida else " "
-                print(f"  {i+1}. [{status}] {sub.titulo}")
-        except IndexError:
-            print("Índice da tarefa principal inválido.")
-
-    def concluir_subtarefa(self, indice_tarefa_principal, indice_subtarefa):
-        try:
-            tarefa_principal = self.tarefas[indice_tarefa_principal]
-            subtarefa = tarefa_principal.subtarefas[indice_subtarefa]
-            subtarefa.concluida = True
-            print(f"Subtarefa '{subtarefa.titulo}' concluída.")
-            self.salvar_dados()  # salva imediatamente
-            # Atualizar status da tarefa principal
-            tarefa_principal.verificar_conclusao()
-        except IndexError:
-            print("Índice inválido para tarefa principal ou subtarefa.")
+    def listar_subtarefas(self, id_tarefa_principal):
+        tarefa_principal = self.obter(id_tarefa_principal)
+        if tarefa_principal is None:
+            print("Tarefa principal inválida.")
+            return
+        if not tarefa_principal.num_subtarefas:
+            print("Esta tarefa principal não tem subtarefas.")
+            return
+        print(f"Subtarefas da tarefa '{tarefa_principal.titulo}':")
+        for i, sub in enumerate(tarefa_principal.subtarefas):
+            status = "✓" if sub.concluida else " "
+            print(f"  {i+1}. [{status}] {sub.titulo}")
+
+    def concluir_subtarefa(self, id_subtarefa):
+        subtarefa = self.obter(id_subtarefa)
+        if subtarefa is None or self.e_principal(id_subtarefa):
+            print("Subtarefa inválida.")
+            return
+        subtarefa.concluida = True # as tarefas acima ficam concluídas quando não resta nada pendente
+        print(f"Subtarefa '{subtarefa.titulo}' concluída.")
+        self._registar_tarefa(self.tarefa_principal_de(subtarefa))
 
 # metodos para comentários
-    def adicionar_comentario(self, indice_tarefa, comentario):
-        try:
-            tarefa = self.tarefas[indice_tarefa]
-            tarefa.comentarios.append(comentario.strip())
-            print(f"Comentário adicionado à tarefa '{tarefa.titulo}'.")
-            self.salvar_dados()  # salva imediatamente
-        except IndexError:
-            print("Índice da tarefa inválido.")
+    def adicionar_comentario(self, tarefa_id, comentario):
+        tarefa = self.obter(tarefa_id)
+        if tarefa is None:
+            print("Tarefa inválida.")
+            return
+        tarefa.comentarios.append(comentario.strip())
+        raiz = self.tarefa_principal_de(tarefa)
+        self._atualizar_texto(raiz)
+        print(f"Comentário adicionado à tarefa '{tarefa.titulo}'.")
+        self._registar_tarefa(raiz)
 
-    def listar_comentarios(self, indice_tarefa):
-        try:
-            tarefa = self.tarefas[indice_tarefa]
-            if not tarefa.comentarios:
-                print("Esta tarefa não tem comentários.")
-                return
-            print(f"Comentários da tarefa '{tarefa.titulo}':")
-            for i, c in enumerate(tarefa.comentarios):
-                print(f"  {i+1}. {c}")
-        except IndexError:
-            print("Índice da tarefa inválido.")
+    def listar_comentarios(self, tarefa_id):
+        tarefa = self.obter(tarefa_id)
+        if tarefa is None:
+            print("Tarefa inválida.")
+            return
+        if not tarefa.num_comentarios:
+            print("Esta tarefa não tem comentários.")
+            return
+        print(f"Comentários da tarefa '{tarefa.titulo}':")
+        for i, c in enumerate(tarefa.comentarios):
+            print(f"  {i+1}. {c}")
 
-    def remover_comentario(self, indice_tarefa, indice_comentario):
+    def remover_comentario(self, tarefa_id, indice_comentario):
         try:
-            tarefa = self.tarefas[indice_tarefa]
+            tarefa = self._obter(tarefa_id)
             comentario_removido = tarefa.comentarios.pop(indice_comentario)
+            raiz = self.tarefa_principal_de(tarefa)
+            self._atualizar_texto(raiz)
             print(f"Comentário removido: '{comentario_removido}'")
+            self._registar_tarefa(raiz)
+        except (KeyError, IndexError):
+            print("Tarefa ou comentário inválido.")
+
+    # Identificadores: tarefas e subtarefas encontradas pelo id em O(1), independentemente da posição
+    def obter(self, tarefa_id): # tarefa principal ou subtarefa (None se não existir)
+        indice = self._posicao_id(tarefa_id)
+        if indice is not None:
+            return self.tarefas[indice]
+        return self._mapa_subtarefas()[0].get(tarefa_id)
+
+    def _obter(self, tarefa_id):
+        tarefa = self.obter(tarefa_id)
+        if tarefa is None:
+            raise KeyError(tarefa_id)
+        return tarefa
+
+    def e_principal(self, tarefa_id):
+        return self._posicao_id(tarefa_id) is not None
+
+    def tarefa_principal_de(self, tarefa): # sobe pelas tarefas mãe até à que está em self.tarefas
+        if self._posicao_id(tarefa.id) is not None:
+            return tarefa
+        pai_de = self._mapa_subtarefas()[1]
+        while tarefa.id in pai_de:
+            tarefa = pai_de[tarefa.id]
+        return tarefa
+
+    def _mapa_subtarefas(self):
+        if self._subtarefas_por_id is None:
+            with _TRAVA_PREGUICOSA:
+                if self._subtarefas_por_id is None:
+                    mapas = {}, {}
+                    for tarefa in self.tarefas:
+                        self._mapear_subtarefas(tarefa, mapas=mapas)
+                    self._pai_de, self._subtarefas_por_id = mapas[1], mapas[0] # só visível depois de completo
+        return self._subtarefas_por_id, self._pai_de
+
+    def _mapear_subtarefas(self, tarefa, remover=False, mapas=None): # acrescenta (ou retira) a árvore de subtarefas ao mapa
+        subtarefas_por_id, pai_de = mapas or (self._subtarefas_por_id, self._pai_de)
+        pendentes = [tarefa]
+        while pendentes:
+            pai = pendentes.pop()
+            if not pai.num_subtarefas:
+                continue
+            for sub in pai.subtarefas:
+                if remover:
+                    subtarefas_por_id.pop(sub.id, None)
+                    pai_de.pop(sub.id, None)
+                else:
+                    subtarefas_por_id[sub.id] = sub
+                    pai_de[sub.id] = pai
+                pendentes.append(sub)
+
+    def _posicao_id(self, tarefa_id):
+        return self._criar_uma_vez("_posicoes", self._calcular_posicoes).get(tarefa_id)
+
+    def _calcular_posicoes(self):
+        ids = self.tarefas.ids() if hasattr(self.tarefas, "ids") else (t.id for t in self.tarefas)
+        return {i: posicao for posicao, i in enumerate(ids)}
+
+    def _posicao(self, tarefa):
+        return self._posicao_id(tarefa.id)
+
+    def id_na_listagem(self, numero): # número mostrado pela última listagem -> id da tarefa
+        if not 1 <= numero <= len(self._ultima_listagem):
+            raise ValueError(numero)
+        tarefa_id = self._ultima_listagem[numero - 1].id
+        if self._posicao_id(tarefa_id) is None: # já foi removida
+            raise ValueError(numero)
+        return tarefa_id
+
+    def id_da_subtarefa(self, id_tarefa_principal, numero): # número mostrado por listar_subtarefas -> id
+        tarefa = self.obter(id_tarefa_principal)
+        if tarefa is None or not 1 <= numero <= tarefa.num_subtarefas:
+            raise ValueError(numero)
+        return tarefa.subtarefas[numero - 1].id
+
+    def _acao_historico(self, acao, tarefa, antes=None): # guarda a ação e devolve o registo para o journal
+        entrada = (acao, tarefa, antes or {})
+        self.historico.append(entrada)
+        return {"op": "historico", "entrada": self._entrada_historico(entrada), "limite": self.limite_historico}
+
+    def _entrada_historico(self, item):
+        # Só a tarefa removida é gravada por inteiro (é a única cópia); as outras são referidas pelo id
+        acao, tarefa, antes = item
+        if acao == "remover":
+            return {"acao": acao, "tarefa": tarefa.to_dict(), "indice": antes["indice"],
+                    "antes": {"depois_de": antes.get("depois_de")}}
+        return {"acao": acao, "id": tarefa.id, "antes": antes}
+
+    def _acao_de_dict(self, h, por_id):
+        if h["acao"] == "remover":
+            tarefa = Tarefa.from_dict(h["tarefa"], preguicoso=True)
+            antes = dict(h.get("antes") or {})
+            antes["indice"] = h.get("indice", len(self.tarefas))
+            return ("remover", tarefa, antes)
+        tarefa = por_id.get(h.get("id"))
+        if tarefa is None: # formato antigo (cópia da tarefa) ou tarefa que já não existe
+            return None
+        return (h["acao"], tarefa, h.get("antes") or {})
+
+    # Pesquisas por etiqueta: custam o tamanho do resultado, não o da lista
+    def tarefas_com_etiqueta(self, etiqueta):
+        return self.indice_etiquetas.tarefas(etiqueta)
+
+    def tarefas_com_etiquetas(self, etiquetas, todas=False): # com alguma (ou todas) das etiquetas
+        indice = self.indice_etiquetas
+        return indice.com_todas(etiquetas) if todas else indice.com_alguma(etiquetas)
+
+    def contar_etiquetas(self):
+        return self.indice_etiquetas.contagens()
+
+    # Filtros combinados: o planeador escolhe o índice mais seletivo e verifica o resto só nos candidatos
+    def consultar(self, consulta=None, **criterios):
+        consulta = consulta or Consulta(**criterios)
+        if hasattr(self.armazenamento, "filtrar_posicoes"): # o motor filtra e ordena; só os candidatos são lidos
+            posicoes = self._posicoes_motor(consulta=consulta)
+            self.ultimo_plano = ("sql", len(posicoes))
+            return [t for t in map(self.tarefas.__getitem__, posicoes) if consulta.aceita(t)]
+        nome, estimativa, obter = self._planear(consulta)
+        self.ultimo_plano = (nome, estimativa)
+        resultado = [t for t in obter() if consulta.aceita(t)]
+        if nome in ("prioridade", "lista completa"): # já vêm pela ordem da listagem
+            return resultado
+        return self.ordem_prioridade.ordenar(resultado)
+
+    def _planear(self, consulta): # devolve (índice, candidatos estimados, função que devolve os candidatos)
+        fontes = []
+        if consulta.etiquetas:
+            etiquetas = self.indice_etiquetas
+            tamanhos = [etiquetas.tamanho(e) for e in consulta.etiquetas]
+            if consulta.todas_etiquetas:
+                fontes.append(("etiquetas", min(tamanhos), lambda: etiquetas.com_todas(consulta.etiquetas)))
+            else:
+                fontes.append(("etiquetas", sum(tamanhos), lambda: etiquetas.com_alguma(consulta.etiquetas)))
+        if consulta.prioridades:
+            ordem = self.ordem_prioridade
+            ordens = sorted({PRIORIDADE_ORDEM.get(p, 4) for p in consulta.prioridades})
+            fontes.append(("prioridade", sum(ordem.contar((o,), (o + 1,)) for o in ordens),
+                           lambda: [t for o in ordens for t in ordem.intervalo((o,), (o + 1,))]))
+        if consulta.prazo_de is not None or consulta.prazo_ate is not None:
+            prazos = self.indice_prazos
+            inicio = (consulta.prazo_de,) if consulta.prazo_de is not None else ()
+            fim = (consulta.prazo_ate + 1,) if consulta.prazo_ate is not None else (float("inf"),)
+            fontes.append(("prazo", prazos.contar(inicio, fim), lambda: prazos.intervalo(inicio, fim)))
+        if not fontes: # só critérios sem índice: percorre a lista pela ordem da listagem
+            return ("lista completa", len(self.tarefas), self.ordem_prioridade.primeiras)
+        return min(fontes, key=lambda fonte: fonte[1])
+
+    # Pesquisa de texto nos títulos, comentários e subtarefas (sem acentos nem maiúsculas, por prefixo)
+    def pesquisar(self, texto, limite=20): # [(tarefa, pontuação)], as mais relevantes primeiro
+        return self.indice_texto.pesquisar(texto, limite)
+
+    def listar_pesquisa(self, texto, limite=20):
+        resultados = self.pesquisar(texto, limite)
+        self._ultima_listagem = [tarefa for tarefa, _ in resultados]
+        if not resultados:
+            print("Nenhuma tarefa encontrada.")
+        _escrever(self._linhas_pesquisa(resultados))
+        return self._ultima_listagem
+
+    def _linhas_pesquisa(self, resultados): # como _linhas_listagem: aviso e relevância na linha da tarefa
+        for i, (tarefa, pontos) in enumerate(resultados):
+            linhas = tarefa.linhas()
+            yield f"{i+1}. {next(linhas)}{self.aviso_prazo(tarefa)} (relevância {pontos})"
+            yield from linhas
+
+    # Prazos: consultas por intervalo sobre o índice ordenado por data
+    def tarefas_atrasadas(self):
+        return self.indice_prazos.atrasadas()
+
+    def tarefas_a_terminar(self, dias=IndicePrazos.DIAS_PROXIMO): # prazo entre hoje e daqui a 'dias' dias
+        return self.indice_prazos.a_terminar(dias)
+
+    def tarefas_entre(self, inicio, fim): # datas (date/datetime), inclusive
+        return self.indice_prazos.entre(inicio.toordinal(), fim.toordinal())
+
+    # Recorrências: as ocorrências futuras são geradas a partir da tarefa modelo, sem criar tarefas
+    def ocorrencias(self, dias=HORIZONTE_AGENDA):
+        hoje = datetime.fromordinal(datetime.now().toordinal())
+        limite = hoje + timedelta(days=dias)
+        geradores = []
+        for modelo in self.indice_recorrencias.tarefas():
+            if modelo.concluida:
+                continue
+            datas = modelo.regra.ocorrencias(modelo.prazo, desde=max(hoje, modelo.prazo + timedelta(days=1)))
+            datas = itertools.takewhile(lambda d: d <= limite, datas)
+            geradores.append(map(Ocorrencia, itertools.repeat(modelo), datas)) # só gera até ao limite
+        return list(heapq.merge(*geradores, key=lambda o: o.prazo_ordinal))
+
+    def agenda(self, dias=HORIZONTE_AGENDA): # tarefas por concluir e ocorrências futuras nos próximos 'dias' dias
+        tarefas = [t for t in self.tarefas_a_terminar(dias) if not t.concluida]
+        return list(heapq.merge(tarefas, self.ocorrencias(dias), key=lambda t: t.prazo_ordinal))
+
+    def materializar_ocorrencia(self, tarefa_id, data, concluida=False): # a ocorrência passa a ser uma tarefa própria
+        modelo = self._obter(tarefa_id)
+        regra = modelo.regra
+        if regra is None or modelo.prazo is None:
+            raise ValueError("A tarefa não é recorrente.")
+        data = datetime.fromordinal(data.toordinal())
+        if data == modelo.prazo:
+            return modelo
+        if next(regra.ocorrencias(modelo.prazo, desde=data), None) != data:
+            raise ValueError("Não há nenhuma ocorrência nessa data.")
+        # a exceção na regra e a nova tarefa ficam na mesma entrada do histórico: desfazer repõe as duas
+        antes = {"modelo": modelo.id, "recorrencia": modelo.recorrencia}
+        modelo.recorrencia = regra.copia(excecoes=regra.excecoes | {data.toordinal()}).texto()
+        raiz = self.tarefa_principal_de(modelo)
+        for indice_tarefas in self._indices():
+            indice_tarefas.atualizar(raiz)
+        tarefa = Tarefa(titulo=modelo.titulo, prioridade=modelo.prioridade, etiquetas=modelo.etiquetas, prazo=data,
+                        origem=modelo.id)
+        tarefa.concluida = concluida
+        self._registar({"op": "atualizar", "indice": self._posicao(raiz), "tarefa": raiz.to_dict()},
+                       self._inserir_tarefa(tarefa), self._acao_historico('adicionar', tarefa, antes))
+        return tarefa
+
+    def concluir_ocorrencia(self, tarefa_id, data):
+        tarefa = self.materializar_ocorrencia(tarefa_id, data, concluida=True)
+        if tarefa.concluida:
+            print("Tarefa marcada como concluída!")
+        else: # era a ocorrência atual: a modelo avança para a seguinte
+            self.concluir_tarefa(tarefa.id)
+
+    def concluir_da_agenda(self, item): # Tarefa ou Ocorrencia devolvida por agenda()
+        if isinstance(item, Ocorrencia): # a ocorrência passa a ser uma tarefa própria, já concluída
+            self.concluir_ocorrencia(item.modelo.id, item.prazo)
+        else:
+            self.concluir_tarefa(item.id)
+
+    def item_da_agenda(self, numero): # número mostrado pela última agenda -> Tarefa ou Ocorrencia
+        if not 1 <= numero <= len(self._ultima_agenda):
+            raise ValueError(numero)
+        return self._ultima_agenda[numero - 1]
+
+    def listar_agenda(self, dias=HORIZONTE_AGENDA):
+        agenda = self._ultima_agenda = self.agenda(dias)
+        if not agenda:
+            print(f"Nada previsto nos próximos {dias} dias.")
+        _escrever(self._linhas_agenda(agenda))
+        return agenda
+
+    def _linhas_agenda(self, agenda):
+        for numero, item in enumerate(agenda, 1):
+            linhas = item.linhas()
+            yield f"{numero}. {item.prazo.strftime('%Y-%m-%d')}  {next(linhas)}{self.aviso_prazo(item)}"
+            yield from linhas
+
+    def estado_prazo(self, tarefa): # "atrasada", "proxima" ou None; só usa os limites do dia, sem criar o índice
+        return (self._indice_prazos if self._indice_prazos is not None else self._prazos_hoje).classificar(tarefa)
+
+    def aviso_prazo(self, tarefa):
+        return {"atrasada": " [ATRASADA!]", "proxima": " [Prazo Próximo]"}.get(self.estado_prazo(tarefa), "")
+
+    def tarefas_por_prioridade(self, n=None): # as n primeiras pela ordem da listagem, em O(n)
+        return self.ordem_prioridade.primeiras(n)
+
+    # Títulos duplicados (sem contar maiúsculas nem acentos)
+    def procurar_titulo(self, titulo):
+        return self.indice_titulos.procurar(titulo)
+
+    def grupos_duplicados(self): # listas de tarefas principais com o mesmo título, pela ordem da lista
+        return sorted(self.indice_titulos.grupos_duplicados(), key=lambda grupo: self._posicao(grupo[0]))
+
+    def listar_duplicados(self): # numerada como a listagem, para escolher uma tarefa a seguir (id_na_listagem)
+        grupos = self.grupos_duplicados()
+        self._ultima_listagem = [tarefa for grupo in grupos for tarefa in grupo]
+        if not grupos:
+            print("Não há tarefas com o mesmo título.")
+        _escrever(self._linhas_duplicados(grupos))
+        return self._ultima_listagem
+
+    def _linhas_duplicados(self, grupos):
+        numero = itertools.count(1)
+        for grupo in grupos:
+            yield f"'{grupo[0].titulo}' ({len(grupo)} tarefas):"
+            for tarefa in grupo:
+                linhas = tarefa.linhas(1)
+                yield f"  {next(numero)}. {next(linhas).lstrip()}{self.aviso_prazo(tarefa)}"
+                yield from linhas
+
+    def _criar_uma_vez(self, atributo, criar): # índices criados quando usados (ver _TRAVA_PREGUICOSA)
+        valor = getattr(self, atributo)
+        if valor is None:
+            with _TRAVA_PREGUICOSA:
+                valor = getattr(self, atributo)
+                if valor is None:
+                    valor = criar()
+                    setattr(self, atributo, valor)
+        return valor
+
+    @property
+    def indice_etiquetas(self):
+        return self._criar_uma_vez("_indice_etiquetas", lambda: IndiceEtiquetas(self.tarefas))
+
+    @property
+    def ordem_prioridade(self):
+        return self._criar_uma_vez("_ordem_prioridade", lambda: OrdemPrioridade(self.tarefas))
+
+    @property
+    def indice_prazos(self):
+        return self._criar_uma_vez("_indice_prazos", lambda: IndicePrazos(self.tarefas))
+
+    @property
+    def indice_recorrencias(self):
+        return self._criar_uma_vez("_indice_recorrencias", lambda: IndiceRecorrencias(self.tarefas))
+
+    @property
+    def indice_texto(self):
+        return self._criar_uma_vez("_indice_texto", lambda: IndiceTexto(self.tarefas))
+
+    def _atualizar_texto(self, tarefa): # comentários ou subtarefas mudaram
+        if self._indice_texto is not None:
+            self._indice_texto.atualizar(tarefa)
+
+    @property
+    def indice_titulos(self):
+        return self._criar_uma_vez("_indice_titulos", lambda: IndiceTitulos(self.tarefas))
+
+    def _indice_subtarefas(self, tarefa_principal):
+        titulos = self._titulos_subtarefas.get(tarefa_principal.id)
+        if titulos is None:
+            titulos = self._titulos_subtarefas[tarefa_principal.id] = IndiceTitulos(tarefa_principal.subtarefas)
+        return titulos
+
+    def _indices(self): # índices já criados (os outros são construídos quando forem precisos)
+        indices = (self._indice_etiquetas, self._indice_titulos, self._ordem_prioridade, self._indice_prazos,
+                   self._indice_texto, self._indice_recorrencias)
+        return [i for i in indices if i is not None]
+
+    def _indexar(self, tarefa):
+        for indice in self._indices():
+            indice.adicionar(tarefa)
+        if self._subtarefas_por_id is not None:
+            self._mapear_subtarefas(tarefa)
+
+    def _desindexar(self, tarefa):
+        for indice in self._indices():
+            indice.remover(tarefa)
+        self._titulos_subtarefas.pop(tarefa.id, None)
+        if self._subtarefas_por_id is not None:
+            self._mapear_subtarefas(tarefa, remover=True)
+
+    def registar_alteracao(self, tarefa_id): # regista o novo estado de uma tarefa (ou subtarefa) editada diretamente
+        tarefa = self._obter(tarefa_id)
+        raiz = self.tarefa_principal_de(tarefa)
+        for indice_tarefas in self._indices(): # qualquer campo pode ter mudado
+            indice_tarefas.atualizar(raiz)
+        self._titulos_subtarefas.pop(tarefa.id, None)
+        if tarefa is not raiz: # o título mudou entre as irmãs
+            self._titulos_subtarefas.pop(self._pai_de[tarefa.id].id, None)
+        self._registar_tarefa(raiz)
+
+    def _registar_tarefa(self, tarefa): # tarefa principal cujo conteúdo mudou
+        self._registar({"op": "atualizar", "indice": self._posicao(tarefa), "tarefa": tarefa.to_dict()})
+
+    def _registar(self, *operacoes):
+        if self.gravador:
+            self.gravador.agendar(operacoes)
+        elif not self.armazenamento.incremental:
             self.salvar_dados()  # salva imediatamente
-        except IndexError:
-            print("Índice da tarefa ou comentário inválido.")
-
-    def salvar_dados(self):
-        data = {
-            "tarefas": [t.to_dict() for t in self.tarefas],
-            "historico": [
-                {"acao": acao, "tarefa": t.to_dict()} for acao, t in self.historico
-            ]
-        }
-        with open(self.arquivo_json, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        else:
+            self.armazenamento.registar(operacoes)
+
+    def _dados_completos(self):
+        if hasattr(self.tarefas, "para_dicts"): # lista sobre o snapshot mmap: não descodifica o que não foi usado
+            return (list(self.tarefas.para_dicts()), [self._entrada_historico(item) for item in self.historico])
+        return ([t.to_dict() for t in self.tarefas],
+                [self._entrada_historico(item) for item in self.historico])
+
+    def flush(self): # espera que as alterações agendadas fiquem gravadas
+        if self.gravador:
+            self.gravador.flush()
+
+    def salvar_dados(self): # grava o estado completo (no JSON: reescreve o snapshot e descarta o journal)
+        self.flush()  # o journal não pode ficar com alterações que o snapshot já inclui
+        self.armazenamento.salvar(*self._dados_completos())
 
     def carregar_dados(self):
-        try:
-            with open(self.arquivo_json, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.tarefas = [Tarefa.from_dict(t) for t in data.get("tarefas", [])]
-                self.historico = [
-                    (h["acao"], Tarefa.from_dict(h["tarefa"])) for h in data.get("historico", [])
-                ]
-        except FileNotFoundError:
-            self.tarefas = []
-            self.historico = []
-
-    #Exporta para Excel todas as tarefas e subtarefas, incluindo comentários, etiquetas e indicando tarefa principal
-    def exportar_para_excel(self, arquivo_excel="ListaTarefas.xlsx"):
+        sem_id = []
+        def construir(dados):
+            if dados.get("id") is None:
+                sem_id.append(dados)
+            return Tarefa.from_dict(dados, preguicoso=self.carregamento_preguicoso)
+        self.tarefas, historico = self.armazenamento.carregar(construir)
+        # ids ainda por ler (snapshot mmap) não podem ser dados a tarefas novas
+        Tarefa._proximo_id = max(Tarefa._proximo_id, getattr(self.armazenamento, "proximo_id", 0))
+        self._posicoes = self._subtarefas_por_id = self._pai_de = None
+        self._indice_etiquetas = self._indice_titulos = self._ordem_prioridade = self._indice_prazos = None
+        self._indice_texto = self._indice_recorrencias = None
+        self._ultima_listagem, self._ultima_agenda = [], []
+        self._titulos_subtarefas = {}
+        # Ligar o histórico às tarefas pelo id (sem descodificar as tarefas que não são referidas)
+        por_id = {}
+        for h in historico:
+            indice = self._posicao_id(h.get("id")) if h["acao"] != "remover" else None
+            if indice is not None:
+                por_id[h["id"]] = self.tarefas[indice]
+        self.historico = deque(maxlen=self.limite_historico)
+        for h in historico:
+            acao = self._acao_de_dict(h, por_id)
+            if acao:
+                self.historico.append(acao)
+        if sem_id: # dados de uma versão sem identificadores: gravar já os ids atribuídos
+            self.salvar_dados()
+
+    def fechar(self): # grava o que estiver pendente e termina as escritas em segundo plano
+        if self.gravador:
+            self.gravador.fechar()
+        self.armazenamento.fechar()
+
+    #Exporta todas as tarefas e subtarefas, incluindo comentários, etiquetas e indicando tarefa principal
+    def linhas_exportacao(self, progresso=None): # uma linha (tuplo na ordem de COLUNAS_EXPORTACAO) de cada vez
+        total = len(self.tarefas)
+        for feitas, t in enumerate(self.tarefas, 1):
+            for nivel, sub in t.arvore(): # a tarefa principal e as subtarefas de todos os níveis
+                yield (t.titulo, sub.titulo, sub.prioridade,
+                       sub.prazo.strftime("%Y-%m-%d") if sub.prazo else None,
+                       sub.concluida,
+                       ", ".join(sub.etiquetas),
+                       "\n".join(sub.comentarios) if sub.num_comentarios else "",
+                       "Subtarefa" if nivel else "Tarefa Principal",
+                       nivel)
+            if progresso and (feitas % PROGRESSO_EXPORTACAO == 0 or feitas == total):
+                progresso(feitas, total) # tarefas principais já exportadas
+
+    def exportar(self, arquivo, progresso=None): # formato escolhido pela extensão: .xlsx, .csv ou .parquet
+        extensao = os.path.splitext(arquivo)[1].lower()
+        if extensao not in EXPORTADORES:
+            raise ValueError(f"Formato de exportação desconhecido: '{extensao}' (use .xlsx, .csv ou .parquet).")
+        EXPORTADORES[extensao](arquivo, self.linhas_exportacao(progresso))
+        print(f"Exportado para {arquivo} com sucesso!")
+
+    def exportar_para_excel(self, arquivo_excel="ListaTarefas.xlsx", progresso=None):
         if not arquivo_excel.endswith(".xlsx"): #guarda extenção xlsx
             arquivo_excel += ".xlsx"
-        dados = []
-        for t in self.tarefas:
-            dados.append({ # Tarefa principal
-                "Tarefa Principal": t.titulo,
-                "Título": t.titulo,
-                "Prioridade": t.prioridade,
-                "Prazo": t.prazo.strftime("%Y-%m-%d") if t.prazo else None,
-                "Concluída": t.concluida,
-                "Etiquetas": ", ".join(t.etiquetas),
-                "Comentários": "\n".join(t.comentarios) if t.comentarios else "",
-                "Tipo": "Tarefa Principal"
-            })   
-            for sub in t.subtarefas: # Subtarefas
-                dados.append({
-                    "Tarefa Principal": t.titulo,
-                    "Título": sub.titulo,
-                    "Prioridade": sub.prioridade,
-                    "Prazo": sub.prazo.strftime("%Y-%m-%d") if sub.prazo else None,
-                    "Concluída": sub.concluida,
-                    "Etiquetas": ", ".join(sub.etiquetas),
-                    "Comentários": "\n".join(sub.comentarios) if sub.comentarios else "",
-                    "Tipo": "Subtarefa"
-                })
-        df = pd.DataFrame(dados)
-        df.to_excel(arquivo_excel, index=False)
-        print(f"Exportado para {arquivo_excel} com sucesso!")
-
-def main():
-    gestor = GestorTarefas()
+        self.exportar(arquivo_excel, progresso)
+
+def pedir_consulta(): # pergunta os critérios da pesquisa combinada na consola
+    def lista(texto):
+        return [v.strip() for v in texto.split(",") if v.strip()]
+    def data(texto):
+        texto = texto.strip()
+        if not texto:
+            return None
+        try:
+            return datetime.strptime(texto, "%Y-%m-%d")
+        except ValueError:
+            print("Formato de data inválido. Este limite será ignorado.")
+            return None
+    prioridades = lista(input("Prioridades (ex: Alta, Média; vazio para todas): "))
+    etiquetas = lista(input("Etiquetas (separadas por vírgula; vazio para todas): "))
+    todas = True
+    if len(etiquetas) > 1:
+        todas = input("Exigir todas as etiquetas (T) ou alguma (A)? [T]: ").strip().lower() != 'a'
+    prazo_de = data(input("Prazo a partir de (AAAA-MM-DD) ou vazio: "))
+    prazo_ate = data(input("Prazo até (AAAA-MM-DD) ou vazio: "))
+    estado = input("Estado (pendentes/concluidas; vazio para todas): ").strip().lower()
+    concluida = {"pendentes": False, "concluidas": True, "concluídas": True}.get(estado)
+    recorrencia = input("Recorrência (diaria/semanal/mensal/anual; vazio para todas): ").strip().lower() or None
+    texto = input("Texto no título (vazio para qualquer): ").strip() or None
+    return Consulta(prioridades, etiquetas, todas, prazo_de, prazo_ate, concluida, recorrencia, texto)
+
+def _comando_pagina(paginador, resposta): # s/a/p N; devolve False se a resposta não for um comando de página
+    if resposta == "s":
+        paginador.seguinte()
+    elif resposta == "a":
+        paginador.anterior()
+    elif resposta.startswith("p") and resposta[1:].strip().isdigit():
+        paginador.ir_para(int(resposta[1:]))
+    else:
+        return False
+    return True
+
+def navegar(gestor, paginador, mostrar_comentarios=False): # mostra a listagem página a página
+    gestor.mostrar_pagina(paginador, mostrar_comentarios)
+    while paginador.total_paginas > 1:
+        resposta = input("s: seguinte, a: anterior, p N: página N, Enter: voltar ao menu: ").strip().lower()
+        if not _comando_pagina(paginador, resposta):
+            return
+        gestor.mostrar_pagina(paginador, mostrar_comentarios)
+
+def escolher_tarefa(gestor, pergunta, paginador=None): # número da página mostrada -> id (ValueError se inválido)
+    paginador = paginador or gestor.paginar()
+    gestor.mostrar_pagina(paginador)
+    while True:
+        resposta = input(f"{pergunta} (ou s/a/p N para mudar de página): ").strip().lower()
+        if not _comando_pagina(paginador, resposta):
+            return gestor.id_na_listagem(int(resposta))
+        gestor.mostrar_pagina(paginador)
+
+def main(gestor=None):
+    gestor = gestor or GestorTarefas()
     while True:
         print("\n--- Gestor de Tarefas ---")
         print("1. Adicionar nova tarefa")
@@ -312,7 +2544,11 @@ def main():
         print("10. Adicionar comentário a uma tarefa")
         print("11. Listar comentários de uma tarefa")
         print("12. Remover comentário de uma tarefa")
-        print("13. Exportar lista de tarefas para Excel")
+        print("13. Exportar lista de tarefas (Excel, CSV ou Parquet)")
+        print("14. Pesquisa combinada (prioridade, etiquetas, prazo, estado...)")
+        print("15. Pesquisar texto (títulos, comentários e subtarefas)")
+        print(f"16. Agenda (tarefas e ocorrências recorrentes dos próximos {HORIZONTE_AGENDA} dias)")
+        print("17. Tarefas com o mesmo título")
         print("0. Sair")
         escolha = input("Escolha uma opção: ")
 
@@ -329,8 +2565,10 @@ def main():
                     prazo= datetime.strptime(prazo_str, "%Y-%m-%d")
                 except ValueError:
                     print("Formato de data inválido. O prazo será ignorado.")
-            recorrencia = input("Recorrência (diaria/semanal/não): ").lower().strip()
-            recorrencia = recorrencia if recorrencia in ['diaria', 'semanal'] else None
+            recorrencia = input("Recorrência (diaria/semanal/mensal/anual, ex.: semanal;intervalo=2;dias=seg,qua;fim=2025-12-31, ou vazio): ").strip()
+            if recorrencia and RegraRecorrencia.de_texto(recorrencia) is None:
+                print("Recorrência inválida. A tarefa não se vai repetir.")
+                recorrencia = None
             tarefa = Tarefa(titulo=titulo.strip(),
                             prioridade=prioridade.strip().capitalize(),
                             etiquetas=[e.strip() for e in etiquetas if e.strip()],
@@ -340,21 +2578,19 @@ def main():
 
         elif escolha == '2':
             filtro = input("Filtrar por etiqueta (deixe vazio para todas): ")
-            gestor.listar_tarefas(filtro_etiqueta=filtro.strip() if filtro else None, mostrar_comentarios=True)
+            navegar(gestor, gestor.paginar(filtro_etiqueta=filtro.strip() if filtro else None), mostrar_comentarios=True)
 
         elif escolha == '3':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa a concluir: ")) - 1
-                gestor.concluir_tarefa(indice)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa a concluir")
+                gestor.concluir_tarefa(tarefa_id)
             except ValueError:
                 print("Por favor, insira um número válido.")
 
         elif escolha == '4':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa a remover: ")) - 1
-                gestor.remover_tarefa(indice)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa a remover")
+                gestor.remover_tarefa(tarefa_id)
             except ValueError:
                 print("Por favor, insira um número válido.")
 
@@ -364,68 +2600,95 @@ def main():
         elif escolha == '6':
             minutos = input("Duração do Temporizador (minutos, padrão 25): ")
             minutos = int(minutos) if minutos.isdigit() else 25
-            gestor.iniciar_temporizador(minutos)
+            ciclos = input(f"Ciclos Pomodoro (pausas de {POMODORO_MINUTOS['pausa']} min e de {POMODORO_MINUTOS['pausa longa']} "
+                           f"a cada {CICLOS_PAUSA_LONGA}; Enter = temporizador simples): ")
+            gestor.iniciar_temporizador(minutos, int(ciclos) if ciclos.isdigit() else 0)
 
         elif escolha == '7':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa principal para adicionar subtarefa: ")) - 1
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa principal para adicionar subtarefa")
                 titulo_sub = input("Título da subtarefa: ").strip()
-                gestor.adicionar_subtarefa(indice, titulo_sub)
+                gestor.adicionar_subtarefa(tarefa_id, titulo_sub)
             except ValueError:
                 print("Por favor, insira um número válido.")
 
         elif escolha == '8':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa principal para listar subtarefas: ")) - 1
-                gestor.listar_subtarefas(indice)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa principal para listar subtarefas")
+                gestor.listar_subtarefas(tarefa_id)
             except ValueError:
                 print("Por favor, insira um número válido.")
 
         elif escolha == '9':
-            gestor.listar_tarefas()
             try:
-                indice_tarefa = int(input("Número da tarefa principal da subtarefa: ")) - 1
-                gestor.listar_subtarefas(indice_tarefa)
-                indice_sub = int(input("Número da subtarefa a concluir: ")) - 1
-                gestor.concluir_subtarefa(indice_tarefa, indice_sub)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa principal da subtarefa")
+                gestor.listar_subtarefas(tarefa_id)
+                id_sub = gestor.id_da_subtarefa(tarefa_id, int(input("Número da subtarefa a concluir: ")))
+                gestor.concluir_subtarefa(id_sub)
             except ValueError:
                 print("Por favor, insira um número válido.")
 
         elif escolha == '10':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa para adicionar comentário: ")) - 1
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa para adicionar comentário")
                 comentario = input("Digite o comentário: ")
-                gestor.adicionar_comentario(indice, comentario)
+                gestor.adicionar_comentario(tarefa_id, comentario)
             except ValueError:
                 print("Por favor, insira um número válido.")    
 
         elif escolha == '11':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa para ver comentários: ")) - 1
-                gestor.listar_comentarios(indice)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa para ver comentários")
+                gestor.listar_comentarios(tarefa_id)
             except ValueError:
                 print("Por favor, insira um número válido.")   
 
         elif escolha == '12':
-            gestor.listar_tarefas()
             try:
-                indice = int(input("Número da tarefa para remover comentário: ")) - 1
-                gestor.listar_comentarios(indice)
+                tarefa_id = escolher_tarefa(gestor, "Número da tarefa para remover comentário")
+                gestor.listar_comentarios(tarefa_id)
                 indice_com = int(input("Número do comentário a remover: ")) - 1
-                gestor.remover_comentario(indice, indice_com)
+                gestor.remover_comentario(tarefa_id, indice_com)
             except ValueError:
                 print("Por favor, insira um número válido.")   
 
         elif escolha == '13':
-            arquivo_excel = input("Nome do arquivo Excel a exportar (padrão ListaTarefas.xlsx): ").strip()
+            arquivo_excel = input("Nome do arquivo a exportar (.xlsx, .csv ou .parquet; padrão ListaTarefas.xlsx): ").strip()
             arquivo_excel = arquivo_excel if arquivo_excel else "ListaTarefas.xlsx"
-            if not arquivo_excel.endswith(".xlsx"):
+            if os.path.splitext(arquivo_excel)[1].lower() not in EXPORTADORES:
                 arquivo_excel += ".xlsx"
-            gestor.exportar_para_excel(arquivo_excel)      
+            try:
+                gestor.exportar(arquivo_excel, progresso=lambda feitas, total: print(
+                    f"\rA exportar: {feitas}/{total} tarefas", end="\n" if feitas == total else "", flush=True))
+            except (ImportError, OSError) as e:
+                print(f"Falha ao exportar: {e}")
+
+        elif escolha == '14':
+            consulta = pedir_consulta()
+            navegar(gestor, gestor.paginar(consulta=consulta), mostrar_comentarios=True)
+
+        elif escolha == '15':
+            texto = input("Texto a pesquisar: ").strip()
+            if texto:
+                gestor.listar_pesquisa(texto)
+
+        elif escolha == '16':
+            if gestor.listar_agenda():
+                resposta = input("Número a concluir (Enter para voltar): ").strip()
+                if resposta:
+                    try:
+                        gestor.concluir_da_agenda(gestor.item_da_agenda(int(resposta)))
+                    except ValueError:
+                        print("Por favor, insira um número válido.")
+
+        elif escolha == '17':
+            if gestor.listar_duplicados():
+                resposta = input("Número da tarefa a remover (Enter para voltar): ").strip()
+                if resposta:
+                    try:
+                        gestor.remover_tarefa(gestor.id_na_listagem(int(resposta)))
+                    except ValueError:
+                        print("Por favor, insira um número válido.")
 
         elif escolha == '0':
             print("Programa encerrado. Até logo!")
@@ -433,9 +2696,48 @@ def main():
         else:
             print("Opção inválida. Tente novamente.")
 
+def verificar_arranque(orcamento_ms=ORCAMENTO_ARRANQUE_MS):
+    # Carrega este ficheiro num interpretador novo com "python -X importtime" e soma o tempo dos imports
+    # que ele faz (sem abrir o menu); devolve False se passar do orçamento
+    import subprocess
+    codigo = ("import importlib.util, sys; sys.stderr.write('-- arranque --\\n'); sys.stderr.flush(); "
+              "spec = importlib.util.spec_from_file_location('arranque', sys.argv[1]); "
+              "spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+    resultado = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo, os.path.abspath(__file__)],
+                               capture_output=True, text=True)
+    if resultado.returncode != 0:
+        print(resultado.stderr.strip().splitlines()[-1])
+        return False
+    imports = []
+    linhas = resultado.stderr.splitlines()
+    for linha in linhas[linhas.index("-- arranque --") + 1:]:
+        if not linha.startswith("import time:"):
+            continue
+        _, acumulado, nome = linha[len("import time:"):].split("|")
+        if acumulado.strip().isdigit() and not nome.startswith("  "): # só os imports de topo (incluem os que eles fazem)
+            imports.append((int(acumulado) / 1000, nome.strip()))
+    total = sum(ms for ms, _ in imports)
+    print(f"Imports ao arrancar: {total:.1f} ms (orçamento: {orcamento_ms} ms)")
+    for ms, nome in heapq.nlargest(5, imports):
+        print(f"  {nome}: {ms:.1f} ms")
+    return total <= orcamento_ms
+
 if __name__ == "__main__":
-    gestor = GestorTarefas()
-    try:
-        main()
-    finally:
-        gestor.salvar_dados() # Garante que os dados são salvos ao sair
+    import argparse
+    parser = argparse.ArgumentParser(description="Gestor de Tarefas (consola)")
+    parser.add_argument("--sqlite", metavar="ARQUIVO_DB", help="usar uma base de dados SQLite em vez de tarefas.json")
+    parser.add_argument("--migrar", nargs=2, metavar=("ARQUIVO_JSON", "ARQUIVO_DB"),
+                        help="importar BaseDados.json/tarefas.json para SQLite e sair")
+    parser.add_argument("--verificar-arranque", action="store_true",
+                        help="medir o tempo dos imports ao arrancar e falhar se passar do orçamento")
+    args = parser.parse_args()
+    if args.verificar_arranque:
+        raise SystemExit(0 if verificar_arranque() else 1)
+    if args.migrar:
+        migrar_para_sqlite(*args.migrar)
+    else:
+        gestor = GestorTarefas(armazenamento=ArmazenamentoSQLite(args.sqlite) if args.sqlite else None)
+        try:
+            main(gestor)
+        finally:
+            gestor.fechar() # Garante que as escritas pendentes terminam ao sair
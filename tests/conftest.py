@@ -0,0 +1,49 @@
+# Os scripts têm nomes que não se importam com 'import' (começam por um número): são carregados pelo caminho.
+# Cada teste corre com a consola (2Consola.py) e com a versão com interface gráfica (3Widget.py).
+import importlib.util
+import pathlib
+
+import pytest
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = {"2Consola.py": "consola", "3Widget.py": "widget"}
+_modulos = {}
+
+
+def carregar(nome):
+    if nome not in _modulos:
+        if nome == "3Widget.py":
+            pytest.importorskip("tkinter")
+        spec = importlib.util.spec_from_file_location(SCRIPTS[nome], RAIZ / nome)
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+        _modulos[nome] = modulo
+    return _modulos[nome]
+
+
+@pytest.fixture(params=list(SCRIPTS), ids=list(SCRIPTS.values()))
+def modulo(request):
+    return carregar(request.param)
+
+
+@pytest.fixture
+def abrir(modulo, tmp_path):
+    # abrir(motor="json" ou "sqlite", **opções do GestorTarefas) -> gestor sobre os ficheiros de tmp_path
+    gestores = []
+
+    def abrir(motor="json", **opcoes):
+        armazenamento = modulo.ArmazenamentoSQLite(str(tmp_path / "tarefas.db")) if motor == "sqlite" else None
+        gestor = modulo.GestorTarefas(str(tmp_path / "tarefas.json"), armazenamento=armazenamento, **opcoes)
+        gestores.append(gestor)
+        return gestor
+
+    yield abrir
+    for gestor in gestores:
+        try:
+            gestor.fechar()
+        except Exception: # os testes de falhas deixam gestores com escritas por fazer
+            pass
+
+
+def titulos(gestor):
+    return [t.titulo for t in gestor.tarefas]
@@ -0,0 +1,152 @@
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from conftest import titulos
+
+
+def test_journal_reaplicado_depois_de_uma_falha(modulo, abrir, tmp_path):
+    g = abrir(autosave=False)
+    for titulo in ("a", "b", "c"):
+        g.adicionar_tarefa(modulo.Tarefa(titulo), verificar_duplicados=False)
+    g.salvar_dados() # snapshot (e '.snap') com a, b e c
+    g.concluir_tarefa(g.tarefas[0].id)
+    g.remover_tarefa(g.tarefas[1].id)
+    g.adicionar_tarefa(modulo.Tarefa("d"), verificar_duplicados=False)
+    # o programa termina sem fechar o gestor, a meio da escrita de um registo
+    with open(g.armazenamento.arquivo_journal, "a", encoding="utf-8") as f:
+        f.write('{"op":"inserir","indice":0,"tar')
+    g2 = abrir()
+    assert titulos(g2) == ["a", "c", "d"]
+    assert g2.tarefas[0].concluida
+    # ao carregar, o histórico perde o 'adicionar' da tarefa removida (a ação 'remover' guarda-a)
+    assert [acao for acao, *_ in g2.historico] == ["adicionar"] * 2 + ["concluir", "remover", "adicionar"]
+
+
+def test_journal_reaplicado_sem_snapshot_mmap(modulo, tmp_path):
+    arquivo = str(tmp_path / "tarefas.json")
+    armazenamento = modulo.ArmazenamentoJSON(arquivo, snapshot_mmap=False)
+    armazenamento.carregar()
+    armazenamento.registar([{"op": "inserir", "indice": 0, "tarefa": modulo.Tarefa("a").to_dict()}])
+    armazenamento.salvar(*armazenamento.carregar())
+    armazenamento.registar([{"op": "inserir", "indice": 1, "tarefa": modulo.Tarefa("b").to_dict()}])
+    tarefas, _ = modulo.ArmazenamentoJSON(arquivo, snapshot_mmap=False).carregar()
+    assert [t["titulo"] for t in tarefas] == ["a", "b"]
+
+
+def test_compactacao_enquanto_se_escreve(modulo, abrir):
+    g = abrir(limite_journal=2000, atraso_autosave=0)
+    compactacoes = []
+    iniciar = g.armazenamento._iniciar_compactacao
+    def contar():
+        compactacoes.append(1)
+        iniciar()
+    g.armazenamento._iniciar_compactacao = contar
+    for i in range(300): # o journal é rodado e compactado várias vezes enquanto as escritas continuam
+        g.adicionar_tarefa(modulo.Tarefa(f"t{i}", etiquetas=["x"]), verificar_duplicados=False)
+        if i % 7 == 0:
+            g.concluir_tarefa(g.tarefas[i // 2].id)
+    g.fechar()
+    assert len(compactacoes) > 1
+    assert not os.path.exists(g.armazenamento.arquivo_journal + ".1")
+    g2 = abrir()
+    assert titulos(g2) == [f"t{i}" for i in range(300)]
+    assert [t.concluida for t in g2.tarefas] == [t.concluida for t in g.tarefas]
+
+
+@pytest.mark.parametrize("motor", ["json", "sqlite"])
+def test_escrita_falhada_nao_perde_alteracoes(modulo, abrir, motor):
+    g = abrir(motor, atraso_autosave=0.01)
+    g.adicionar_tarefa(modulo.Tarefa("a"), verificar_duplicados=False)
+    g.flush()
+    armazenamento = g.armazenamento
+    registar = armazenamento.registar
+    falhas = []
+    def falhar_uma_vez(operacoes):
+        if not falhas:
+            falhas.append(operacoes)
+            if motor == "json":
+                registar(operacoes) # o journal fica escrito, mas a escrita é dada como falhada
+            raise OSError("disco cheio")
+        registar(operacoes)
+    armazenamento.registar = falhar_uma_vez
+    g.adicionar_tarefa(modulo.Tarefa("b"), verificar_duplicados=False)
+    with pytest.raises(OSError):
+        g.flush()
+    g.adicionar_tarefa(modulo.Tarefa("c"), verificar_duplicados=False)
+    g.flush() # a nova tentativa grava o estado completo
+    g.fechar()
+    g2 = abrir(motor)
+    assert titulos(g2) == ["a", "b", "c"]
+    assert len(g2.historico) == 3
+
+
+def test_snapshot_copiado_na_thread_que_altera(modulo, abrir):
+    g = abrir(usar_journal=False, atraso_autosave=0)
+    threads = []
+    obter = g.gravador.obter_dados
+    def registar_thread():
+        threads.append(threading.current_thread())
+        return obter()
+    g.gravador.obter_dados = registar_thread
+    for i in range(20):
+        g.adicionar_tarefa(modulo.Tarefa(f"t{i}"), verificar_duplicados=False)
+    g.fechar()
+    assert threads and set(threads) == {threading.current_thread()}
+    assert len(abrir().tarefas) == 20
+
+
+def test_fechar_outra_vez_depois_de_uma_falha(modulo, abrir):
+    g = abrir(atraso_autosave=10)
+    armazenamento = g.armazenamento
+    def falhar(*args):
+        raise OSError("sempre")
+    armazenamento.registar = armazenamento.salvar = falhar
+    g.adicionar_tarefa(modulo.Tarefa("a"), verificar_duplicados=False)
+    with pytest.raises(OSError):
+        g.fechar()
+    with pytest.raises(OSError): # a thread de escrita já terminou: não fica à espera dela
+        g.fechar()
+    del armazenamento.registar, armazenamento.salvar
+    g.fechar()
+    assert titulos(abrir()) == ["a"]
+
+
+def _gestor_completo(modulo, g):
+    g.adicionar_tarefa(modulo.Tarefa("Relatório", prioridade="Alta", etiquetas=["trabalho", "mensal"],
+                                      prazo=datetime(2030, 1, 31), recorrencia="mensal",
+                                      comentarios=["rever números"]), verificar_duplicados=False)
+    g.adicionar_tarefa(modulo.Tarefa("Férias", prioridade="Baixa", prazo=datetime(2030, 8, 1)),
+                       verificar_duplicados=False)
+    principal = g.tarefas[1].id
+    g.adicionar_subtarefa(principal, "Reservar hotel")
+    g.adicionar_subtarefa(principal, "Comprar bilhetes")
+    g.concluir_subtarefa(g.tarefas[1].subtarefas[0].id)
+    g.adicionar_comentario(principal, "julho ou agosto")
+    g.concluir_tarefa(g.tarefas[0].id) # recorrente: fica o registo e a modelo avança
+    g.adicionar_tarefa(modulo.Tarefa("Ler"), verificar_duplicados=False)
+    g.remover_tarefa(g.tarefas[-1].id)
+
+
+def test_json_para_sqlite_e_de_volta(modulo, abrir, tmp_path):
+    g = abrir(autosave=False)
+    _gestor_completo(modulo, g)
+    g.fechar()
+    g = abrir()
+    esperado = [t.to_dict() for t in g.tarefas]
+    historico = [acao for acao, *_ in g.historico]
+    g.fechar()
+
+    modulo.migrar_para_sqlite(str(tmp_path / "tarefas.json"), str(tmp_path / "tarefas.db"))
+    sqlite = abrir("sqlite")
+    assert [t.to_dict() for t in sqlite.tarefas] == esperado
+    assert [acao for acao, *_ in sqlite.historico] == historico
+    assert sqlite.tarefas[1].subtarefas[0].concluida
+
+    copia = modulo.ArmazenamentoJSON(str(tmp_path / "copia.json"))
+    copia.salvar(*sqlite._dados_completos())
+    tarefas, entradas = modulo.ArmazenamentoJSON(str(tmp_path / "copia.json")).carregar()
+    assert [modulo.Tarefa.from_dict(t).to_dict() for t in tarefas] == esperado
+    assert [h["acao"] for h in entradas] == historico
@@ -0,0 +1,186 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import titulos
+
+
+def test_regra_de_recorrencia(modulo):
+    regra = modulo.RegraRecorrencia.de_texto("semanal;intervalo=2;dias=seg,qua;fim=2030-02-28")
+    assert regra.texto() == "semanal;intervalo=2;dias=seg,qua;fim=2030-02-28"
+    datas = list(regra.ocorrencias(datetime(2030, 1, 7)))
+    assert [d.strftime("%m-%d") for d in datas] == ["01-07", "01-09", "01-21", "01-23", "02-04", "02-06",
+                                                   "02-18", "02-20"]
+    mensal = modulo.RegraRecorrencia.de_texto("mensal;dia=31")
+    assert mensal.proxima(datetime(2030, 1, 31)) == datetime(2030, 2, 28)
+    assert mensal.proxima(datetime(2030, 2, 28)) == datetime(2030, 3, 31)
+    assert modulo.RegraRecorrencia.de_texto("todas as sextas") is None # texto livre antigo
+
+
+def test_cache_de_regras_limitada(modulo):
+    de_texto = modulo.RegraRecorrencia.de_texto
+    for dia in range(2 * modulo.LIMITE_CACHE_REGRAS): # cada exceção dá um texto diferente
+        data = datetime(2030, 1, 1) + timedelta(days=dia)
+        assert de_texto(f"diaria;exceto={data:%Y-%m-%d}").excecoes == {data.toordinal()}
+    assert de_texto.cache_info().currsize <= modulo.LIMITE_CACHE_REGRAS
+    assert de_texto("semanal") is de_texto("semanal")
+
+
+@pytest.mark.parametrize("motor", ["json", "sqlite"])
+def test_concluir_recorrente_e_desfazer(modulo, abrir, motor):
+    g = abrir(motor, autosave=False)
+    hoje = datetime.fromordinal(datetime.now().toordinal())
+    g.adicionar_tarefa(modulo.Tarefa("Regar", prazo=hoje, recorrencia="diaria"), verificar_duplicados=False)
+    modelo = g.tarefas[0]
+    g.concluir_tarefa(modelo.id)
+    assert modelo.prazo == hoje + timedelta(days=1) and not modelo.concluida
+    registo = g.tarefas[1]
+    assert registo.concluida and registo.origem == modelo.id and registo.prazo == hoje
+    g.desfazer_ultima_acao()
+    assert titulos(g) == ["Regar"] and modelo.prazo == hoje
+    g.concluir_tarefa(modelo.id)
+    g.fechar()
+    g2 = abrir(motor)
+    assert [(t.titulo, t.prazo, t.concluida) for t in g2.tarefas] == [
+        ("Regar", hoje + timedelta(days=1), False), ("Regar", hoje, True)]
+
+
+def test_ocorrencias_da_agenda(modulo, abrir):
+    g = abrir(autosave=False)
+    amanha = datetime.fromordinal(datetime.now().toordinal() + 1)
+    g.adicionar_tarefa(modulo.Tarefa("Reunião", prazo=amanha, recorrencia="semanal"), verificar_duplicados=False)
+    agenda = g.agenda(20)
+    assert [item.prazo for item in agenda] == [amanha + timedelta(days=7 * k) for k in range(3)]
+
+
+def test_desfazer_remocao_e_adicao(modulo, abrir):
+    g = abrir(autosave=False)
+    for titulo in ("a", "b", "c"):
+        g.adicionar_tarefa(modulo.Tarefa(titulo), verificar_duplicados=False)
+    g.remover_tarefa(g.tarefas[1].id)
+    g.desfazer_ultima_acao()
+    assert titulos(g) == ["a", "b", "c"]
+    g.desfazer_ultima_acao()
+    assert titulos(g) == ["a", "b"]
+    g.fechar()
+    assert titulos(abrir()) == ["a", "b"]
+
+
+def test_indices_acompanham_as_alteracoes(modulo, abrir):
+    g = abrir(autosave=False)
+    g.adicionar_tarefa(modulo.Tarefa("Comprar pão", etiquetas=["casa"]), verificar_duplicados=False)
+    g.adicionar_tarefa(modulo.Tarefa("Relatório", prioridade="Alta", etiquetas=["trabalho"]),
+                       verificar_duplicados=False)
+    # os índices só são criados quando usados e depois mantidos a cada alteração
+    assert [t.titulo for t in g.tarefas_com_etiqueta("casa")] == ["Comprar pão"]
+    assert [t.titulo for t, _ in g.pesquisar("relatorio")] == ["Relatório"]
+    assert [t.titulo for t in g.tarefas_por_prioridade()] == ["Relatório", "Comprar pão"]
+    g.adicionar_tarefa(modulo.Tarefa("comprar pao", etiquetas=["casa"]), verificar_duplicados=False)
+    g.adicionar_comentario(g.tarefas[1].id, "números do trimestre")
+    g.remover_tarefa(g.tarefas[0].id)
+    assert [t.titulo for t in g.tarefas_com_etiqueta("casa")] == ["comprar pao"]
+    assert [t.titulo for t, _ in g.pesquisar("trimestre")] == ["Relatório"]
+    assert [t.titulo for t in g.procurar_titulo("Comprar Pão")] == ["comprar pao"]
+    assert g.grupos_duplicados() == []
+    assert [t.titulo for t in g.tarefas_por_prioridade()] == ["Relatório", "comprar pao"]
+
+
+def test_carregamento_preguicoso_de_varias_threads(modulo, abrir):
+    g = abrir(autosave=False)
+    for i in range(300):
+        g.adicionar_tarefa(modulo.Tarefa(f"t{i}", subtarefas=[modulo.Tarefa(f"s{i}.{j}") for j in range(3)],
+                                         comentarios=[f"c{i}"]), verificar_duplicados=False)
+    ids_subtarefas = [s.id for t in g.tarefas for s in t.subtarefas]
+    g.fechar()
+    g = abrir(autosave=False) # as tarefas só são descodificadas quando usadas
+    barreira = threading.Barrier(4)
+    vistos, erros = [], []
+    def usar():
+        try:
+            barreira.wait()
+            tarefas = list(g.tarefas)
+            dicts = [t.to_dict() for t in tarefas]
+            subtarefas = [g.obter(i) for i in ids_subtarefas]
+            vistos.append((tarefas, subtarefas, dicts, [t.comentarios for t in tarefas]))
+        except Exception as e:
+            erros.append(e)
+    threads = [threading.Thread(target=usar) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not erros
+    tarefas, subtarefas, *_ = vistos[0]
+    for outras, outras_subtarefas, dicts, comentarios in vistos: # os mesmos objetos em todas as threads
+        assert all(a is b for a, b in zip(tarefas, outras)) and all(a is b for a, b in zip(subtarefas, outras_subtarefas))
+        assert all(len(d["subtarefas"]) == 3 for d in dicts) and all(c == [f"c{i}"] for i, c in enumerate(comentarios))
+    assert [s.id for s in subtarefas] == ids_subtarefas
+
+
+def test_concluir_e_materializar_ocorrencias_da_agenda(modulo, abrir):
+    g = abrir(autosave=False)
+    hoje = datetime.fromordinal(datetime.now().toordinal())
+    g.adicionar_tarefa(modulo.Tarefa("Ginásio", etiquetas=["saúde"], prazo=hoje, recorrencia="diaria"),
+                       verificar_duplicados=False)
+    modelo = g.tarefas[0]
+    g.listar_agenda(3)
+    assert [item.prazo for item in g._ultima_agenda] == [hoje + timedelta(days=d) for d in range(4)]
+    g.concluir_da_agenda(g.item_da_agenda(3)) # ocorrência de depois de amanhã: passa a tarefa concluída
+    concluida = g.tarefas[-1]
+    assert (concluida.titulo, concluida.prazo, concluida.concluida, concluida.origem) == (
+        "Ginásio", hoje + timedelta(days=2), True, modelo.id)
+    assert [o.prazo for o in g.ocorrencias(3)] == [hoje + timedelta(days=d) for d in (1, 3)]
+    editada = g.materializar_ocorrencia(modelo.id, hoje + timedelta(days=1))
+    assert not editada.concluida and editada.etiquetas == ("saúde",)
+    with pytest.raises(ValueError):
+        g.materializar_ocorrencia(modelo.id, hoje + timedelta(days=1)) # já não é uma ocorrência
+    g.desfazer_ultima_acao() # a tarefa sai e a regra perde a exceção
+    assert [o.prazo for o in g.ocorrencias(3)] == [hoje + timedelta(days=d) for d in (1, 3)]
+    g.concluir_da_agenda(g.item_da_agenda(1)) # a própria modelo: avança para a ocorrência seguinte
+    assert modelo.prazo == hoje + timedelta(days=1)
+    with pytest.raises(ValueError):
+        g.item_da_agenda(5)
+    g.fechar()
+    g2 = abrir()
+    assert [(t.prazo, t.concluida) for t in g2.tarefas] == [
+        (hoje + timedelta(days=1), False), (hoje + timedelta(days=2), True), (hoje, True)]
+
+
+def test_pesquisa_e_agenda_com_subtarefas_depois_da_tarefa(modulo, abrir, capsys):
+    g = abrir(autosave=False)
+    amanha = datetime.fromordinal(datetime.now().toordinal() + 1)
+    g.adicionar_tarefa(modulo.Tarefa("Mudança de casa", prazo=amanha), verificar_duplicados=False)
+    g.adicionar_subtarefa(g.tarefas[0].id, "Caixas")
+    capsys.readouterr()
+    g.listar_pesquisa("mudança")
+    linhas = capsys.readouterr().out.splitlines()
+    assert linhas[0].startswith("1. [ ] Mudança de casa") and " [Prazo Próximo] (relevância " in linhas[0]
+    assert linhas[1].startswith("  [ ] Caixas") and len(linhas) == 2
+    g.listar_agenda(7)
+    linhas = capsys.readouterr().out.splitlines()
+    assert linhas[0].startswith(f"1. {amanha:%Y-%m-%d}  [ ] Mudança de casa") and linhas[0].endswith("[Prazo Próximo]")
+    assert linhas[1].startswith("  [ ] Caixas") and len(linhas) == 2
+
+
+def test_estado_do_prazo_sem_criar_o_indice(modulo, abrir):
+    g = abrir(autosave=False)
+    hoje = datetime.fromordinal(datetime.now().toordinal())
+    for dias in (-1, 1, 30):
+        g.adicionar_tarefa(modulo.Tarefa(f"t{dias}", prazo=hoje + timedelta(days=dias)), verificar_duplicados=False)
+    assert [g.estado_prazo(t) for t in g.tarefas] == ["atrasada", "proxima", None]
+    assert g._indice_prazos is None
+
+
+def test_listar_e_remover_duplicados(modulo, abrir, capsys):
+    g = abrir(autosave=False)
+    for titulo in ("Ler", "Correr", "ler", "Correr", "Lêr"):
+        g.adicionar_tarefa(modulo.Tarefa(titulo), verificar_duplicados=False)
+    capsys.readouterr()
+    assert [[t.titulo for t in grupo] for grupo in g.grupos_duplicados()] == [["Ler", "ler", "Lêr"], ["Correr", "Correr"]]
+    g.listar_duplicados()
+    linhas = capsys.readouterr().out.splitlines()
+    assert linhas[0] == "'Ler' (3 tarefas):" and linhas[4] == "'Correr' (2 tarefas):"
+    assert linhas[5].startswith("  4. [ ] Correr")
+    g.remover_tarefa(g.id_na_listagem(4))
+    assert [[t.titulo for t in grupo] for grupo in g.grupos_duplicados()] == [["Ler", "ler", "Lêr"]]
@@ -0,0 +1,30 @@
+def _temporizadores(modulo):
+    agora = [0.0]
+    return modulo.Temporizadores(relogio=lambda: agora[0]), agora
+
+
+def test_tique_atrasado_avisa_cada_fase(modulo):
+    temporizadores, agora = _temporizadores(modulo)
+    pomodoro = temporizadores.iniciar(1, "Estudar", pomodoro=True)
+    agora[0] = (25 * 4 + 5 * 3) * 60 + 1 # quatro ciclos de trabalho e três pausas num só tique
+    eventos = temporizadores.tique()
+    assert [e.fase for e in eventos] == ["trabalho", "pausa"] * 3 + ["trabalho"]
+    assert [e.aviso() for e in eventos[:2]] == ["'Estudar': ciclo 1 concluído. Pausa de 5 minutos.",
+                                                "'Estudar': fim da pausa. De volta ao trabalho!"]
+    assert eventos[-1].aviso() == "'Estudar': ciclo 4 concluído. Pausa longa de 15 minutos."
+    assert pomodoro.fase == "pausa longa" and pomodoro.fim == (25 * 4 + 5 * 3 + 15) * 60
+
+
+def test_temporizador_simples_sai_ao_terminar(modulo):
+    temporizadores, agora = _temporizadores(modulo)
+    simples = temporizadores.iniciar(1, "Ler", minutos=1)
+    agora[0] = 30
+    temporizadores.pausar(1)
+    agora[0] = 500 # em pausa o tempo não conta
+    assert temporizadores.tique() == []
+    temporizadores.retomar(1)
+    agora[0] = 530
+    eventos = temporizadores.tique()
+    assert [(e.temporizador, e.fase) for e in eventos] == [(simples, "trabalho")]
+    assert eventos[0].aviso() == "Temporizador concluído para 'Ler'! Hora de fazer uma pausa."
+    assert 1 not in temporizadores